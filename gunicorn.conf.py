@@ -0,0 +1,29 @@
+"""Gunicorn settings, read automatically when gunicorn starts in this directory.
+
+Worker count and bind address come from gunicorn's own WEB_CONCURRENCY and PORT
+environment variables.
+"""
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
+
+wsgi_app = 'task_manager.wsgi:application'
+
+# Run django.setup() once in the master, so workers added under load are forked
+# ready instead of importing the project themselves. Code changes need a restart,
+# not a HUP.
+preload_app = True
+
+
+def when_ready(server):
+    # Compiled templates and URL patterns are inherited by every forked worker
+    from task_manager_app.warmup import warmup
+    warmup(databases=False)
+
+
+def post_worker_init(worker):
+    # Connections can't be shared across fork, so each worker opens its own
+    # before it accepts requests
+    from task_manager_app.warmup import warmup
+    timings = warmup()
+    worker.log.info('Worker warmed up in %.1f ms', sum(timings.values()) * 1000)
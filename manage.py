@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
+    # Tests run against their own SQLite databases, shards included
+    settings_module = 'task_manager.test_settings' if sys.argv[1:2] == ['test'] else 'task_manager.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'task_manager_app.sharding.ShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,12 +77,28 @@ WSGI_APPLICATION = 'task_manager.wsgi.application'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 
+# Keep connections open between requests so the ones a worker opens while
+# warming up (task_manager_app.warmup) serve its first requests
+CONN_MAX_AGE = int(os.environ.get("CONN_MAX_AGE", 60))
+
 DATABASES = {
     'default': dj_database_url.config(
-        default=os.environ.get("DATABASE_URL")
+        default=os.environ.get("DATABASE_URL"),
+        conn_max_age=CONN_MAX_AGE,
+        conn_health_checks=True,
     )
 }
 
+# Extra databases holding users' projects, tasks and deadlines, e.g.
+# SHARD_DATABASE_URLS=sqlite:///shard1.sqlite3,sqlite:///shard2.sqlite3
+# Each one becomes shard_<n>; migrate it with `manage.py migrate --database shard_<n>`.
+TASK_SHARDS = ['default']
+for index, url in enumerate(filter(None, os.environ.get("SHARD_DATABASE_URLS", "").split(',')), start=1):
+    DATABASES[f'shard_{index}'] = dj_database_url.parse(url.strip(), conn_max_age=CONN_MAX_AGE, conn_health_checks=True)
+    TASK_SHARDS.append(f'shard_{index}')
+
+DATABASE_ROUTERS = ['task_manager_app.sharding.ShardRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,19 @@
+"""
+Settings for `manage.py test`, which picks them up automatically (see manage.py).
+
+Runs against SQLite with two extra shards, so the sharding code is exercised by
+default instead of only when SHARD_DATABASE_URLS happens to be exported.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    alias: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'test_{alias}.sqlite3',
+    }
+    for alias in ('default', 'shard_1', 'shard_2')
+}
+TASK_SHARDS = list(DATABASES)
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
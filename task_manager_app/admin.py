@@ -1,3 +1,206 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-# Register your models here.
+from .models import Deadline, Project, Task, UserProfile
+from .sharding import ADMIN_SHARD_PARAM, get_shards, lock_users, shard_for_user
+
+# Below this many rows the exact COUNT(*) is cheap and more useful than an estimate
+ESTIMATE_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that reads the row count of an unfiltered table from PostgreSQL's statistics."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                        [queryset.model._meta.db_table],
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] >= ESTIMATE_THRESHOLD:
+                    return row[0]
+        return super().count
+
+
+class ShardFilter(admin.SimpleListFilter):
+    """Lists the shards; ShardMiddleware routes the whole admin to the one picked."""
+    title = 'shard'
+    parameter_name = ADMIN_SHARD_PARAM
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.current = request.shard
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in get_shards()]
+
+    def has_output(self):
+        return len(self.lookup_choices) > 1
+
+    def value(self):
+        return self.current
+
+    def queryset(self, request, queryset):
+        return queryset
+
+    def choices(self, changelist):
+        # No "All" choice: a changelist reads from a single database
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class ShardedAdmin(LargeTableAdmin):
+    """Admin for a sharded model. Its writes lock the users owning the rows they change.
+
+    Owners being moved to another shard make the write fail with a 503 (see ShardMiddleware).
+    """
+    # Lookup from the model to the user owning the row
+    owner_field = None
+
+    def owner_id(self, obj):
+        *path, field = self.owner_field.split('__')
+        for name in path:
+            obj = getattr(obj, name)
+        return getattr(obj, f'{field}_id')
+
+    def lock_owners(self, queryset):
+        lock_users(queryset.order_by().values_list(self.owner_field, flat=True).distinct())
+
+    def save_model(self, request, obj, form, change):
+        owners = {self.owner_id(obj)}
+        if change:
+            # The row may have been taken from another user's project
+            owners.update(self.model._default_manager.filter(pk=obj.pk).values_list(self.owner_field, flat=True))
+        lock_users(owners)
+        super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        lock_users([self.owner_id(obj)])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        self.lock_owners(queryset)
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(Project)
+class ProjectAdmin(ShardedAdmin):
+    list_display = ('name', 'user', 'status', 'updated_at')
+    # Only indexed columns: a filter on anything else scans the whole table
+    list_filter = (ShardFilter, 'updated_at')
+    # auth_user may live on another database than the project, so no join
+    list_select_related = ()
+    search_fields = ('name',)
+    autocomplete_fields = ('user',)
+    actions = ('mark_in_progress', 'mark_completed')
+    owner_field = 'user'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('user')
+
+    def get_readonly_fields(self, request, obj=None):
+        # Changing the owner would leave the project on the old owner's shard
+        return ('user',) if obj else ()
+
+    def save_model(self, request, obj, form, change):
+        # The owner is read-only once the project exists
+        lock_users([obj.user_id])
+        if not change:
+            obj.save(using=shard_for_user(obj.user))
+        else:
+            obj.save()
+
+    def _set_status(self, request, queryset, status):
+        self.lock_owners(queryset)
+        updated = queryset.update(status=status, updated_at=timezone.now())
+        self.message_user(request, f'{updated} projects updated.', messages.SUCCESS)
+
+    @admin.action(description='Mark selected projects as in progress')
+    def mark_in_progress(self, request, queryset):
+        self._set_status(request, queryset, 'in_progress')
+
+    @admin.action(description='Mark selected projects as completed')
+    def mark_completed(self, request, queryset):
+        self._set_status(request, queryset, 'completed')
+
+
+@admin.register(Task)
+class TaskAdmin(ShardedAdmin):
+    list_display = ('title', 'project', 'status', 'priority', 'is_completed', 'due_date', 'updated_at')
+    list_filter = (ShardFilter, 'updated_at', 'due_date', 'completed_at')
+    list_select_related = ('project',)
+    search_fields = ('title',)
+    autocomplete_fields = ('project', 'parent')
+    actions = ('mark_completed', 'mark_todo', 'set_high_priority', 'set_low_priority')
+    owner_field = 'project__user'
+
+    def _update(self, request, queryset, **values):
+        self.lock_owners(queryset)
+        # One UPDATE statement; updated_at is set by hand because update() skips auto_now
+        updated = queryset.update(updated_at=timezone.now(), **values)
+        self.message_user(request, f'{updated} tasks updated.', messages.SUCCESS)
+
+    @admin.action(description='Mark selected tasks as done')
+    def mark_completed(self, request, queryset):
+        # Tasks that were already done keep their completion time
+        self._update(request, queryset, status='D', is_completed=True,
+                     completed_at=Coalesce('completed_at', Value(timezone.now())))
+
+    @admin.action(description='Mark selected tasks as to do')
+    def mark_todo(self, request, queryset):
+        self._update(request, queryset, status='T', is_completed=False, completed_at=None)
+
+    @admin.action(description='Set priority to high')
+    def set_high_priority(self, request, queryset):
+        self._update(request, queryset, priority='H')
+
+    @admin.action(description='Set priority to low')
+    def set_low_priority(self, request, queryset):
+        self._update(request, queryset, priority='L')
+
+
+@admin.register(Deadline)
+class DeadlineAdmin(ShardedAdmin):
+    list_display = ('task', 'original_due_date', 'extended_due_date', 'updated_at')
+    list_filter = (ShardFilter, 'updated_at')
+    list_select_related = ('task',)
+    search_fields = ('task__title',)
+    autocomplete_fields = ('task',)
+    actions = ('clear_extensions',)
+    owner_field = 'task__project__user'
+
+    @admin.action(description='Remove extensions from selected deadlines')
+    def clear_extensions(self, request, queryset):
+        self.lock_owners(queryset)
+        updated = queryset.update(extended_due_date=None, extension_reason='', updated_at=timezone.now())
+        self.message_user(request, f'{updated} deadlines updated.', messages.SUCCESS)
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(LargeTableAdmin):
+    list_display = ('user', 'bio')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'user__email')
+    autocomplete_fields = ('user',)
+    exclude = ('calendar_token',)
@@ -0,0 +1,173 @@
+"""Productivity statistics over a user's task history, computed with NumPy."""
+from datetime import datetime
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ArchivedTask, Project, Task
+
+DAY = 86400
+PERCENTILES = (50, 75, 90, 95)
+# Histogram bucket edges for cycle time, in days
+CYCLE_TIME_BINS = (0, 1, 2, 3, 5, 7, 14, 30, 60, 90, np.inf)
+THROUGHPUT_WEEKS = 12
+CACHE_TIMEOUT = 60 * 60
+
+COLUMN_TYPES = {
+    'created': np.float64,
+    'completed': np.float64,
+    'due': np.float64,
+    'priority': 'U1',
+    'project': np.int64,
+    'done': bool,
+}
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows.iterator(chunk_size=size):
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _timestamps(values):
+    return np.fromiter(
+        (value.timestamp() if value is not None else np.nan for value in values),
+        dtype=np.float64, count=len(values),
+    )
+
+
+def _parse(values):
+    return [datetime.fromisoformat(value) if value else None for value in values]
+
+
+def load_task_arrays(user, chunk_size=5000):
+    """Read just the columns the report needs, a chunk at a time, into NumPy arrays.
+
+    Timestamps are epoch seconds with NaN for missing values; ``completed`` is when a
+    done task was completed. Archived tasks are included as done.
+    """
+    parts = {name: [] for name in COLUMN_TYPES}
+
+    def add(created, completed, due, priority, project, done):
+        for name, values in zip(COLUMN_TYPES, (created, completed, due, priority, project, done)):
+            if name in ('created', 'completed', 'due'):
+                parts[name].append(_timestamps(values))
+            else:
+                parts[name].append(np.array(values, dtype=COLUMN_TYPES[name]))
+
+    # Tasks marked done by a bulk update() may lack completed_at; their last update is the best guess
+    tasks = Task.objects.filter(project__user=user).order_by().values_list(
+        'created_at', Coalesce('completed_at', 'updated_at'), 'due_date', 'priority', 'project_id', 'status', 'is_completed',
+    )
+    for chunk in _chunks(tasks, chunk_size):
+        created, completed, due, priority, project, status, is_completed = zip(*chunk)
+        done = np.array(status, dtype='U1') == 'D'
+        done |= np.array(is_completed, dtype=bool)
+        add(created, completed, due, priority, project, done)
+
+    archived = ArchivedTask.objects.filter(project__user=user).order_by().values_list(
+        'data__created_at', 'completed_at', 'data__due_date', 'data__priority', 'project_id',
+    )
+    for chunk in _chunks(archived, chunk_size):
+        created, completed, due, priority, project = zip(*chunk)
+        add(_parse(created), completed, _parse(due), priority, project, np.ones(len(chunk), dtype=bool))
+
+    return {
+        name: np.concatenate(values) if values else np.array([], dtype=COLUMN_TYPES[name])
+        for name, values in parts.items()
+    }
+
+
+def compute_report(arrays, now=None):
+    now = (now or timezone.now()).timestamp()
+    done = arrays['done']
+    due = arrays['due']
+    has_due = ~np.isnan(due)
+
+    cycle_days = (arrays['completed'][done] - arrays['created'][done]) / DAY
+    if cycle_days.size:
+        values = np.percentile(cycle_days, PERCENTILES).round(2).tolist()
+        mean_cycle_days = round(float(cycle_days.mean()), 2)
+    else:
+        values, mean_cycle_days = [None] * len(PERCENTILES), None
+    percentiles = [{'percentile': p, 'days': value} for p, value in zip(PERCENTILES, values)]
+    histogram, _ = np.histogram(cycle_days, bins=CYCLE_TIME_BINS)
+
+    # Completions per week, most recent week first
+    weeks_ago = ((now - arrays['completed'][done]) // (7 * DAY)).astype(np.int64)
+    weeks_ago = weeks_ago[(weeks_ago >= 0) & (weeks_ago < THROUGHPUT_WEEKS)]
+    throughput = np.bincount(weeks_ago, minlength=THROUGHPUT_WEEKS)
+
+    by_priority = {}
+    for code, label in Task.PRIORITY_CHOICES:
+        mask = arrays['priority'] == code
+        total = int(mask.sum())
+        by_priority[label] = {
+            'total': total,
+            'completed': int((mask & done).sum()),
+            'completion_rate': round(float((mask & done).sum() / total * 100), 1) if total else None,
+        }
+
+    # Overdue: still open past the due date, or completed after it
+    overdue = has_due & np.where(done, arrays['completed'] > due, now > due)
+    project_ids, index = np.unique(arrays['project'], return_inverse=True)
+    with_due = np.bincount(index, weights=has_due, minlength=project_ids.size)
+    late = np.bincount(index, weights=overdue, minlength=project_ids.size)
+    overdue_rate = {
+        int(project_id): round(float(late[i] / with_due[i] * 100), 1)
+        for i, project_id in enumerate(project_ids) if with_due[i]
+    }
+
+    return {
+        'total_tasks': int(done.size),
+        'completed_tasks': int(done.sum()),
+        'cycle_time': {
+            'mean_days': mean_cycle_days,
+            'percentiles': percentiles,
+            'histogram': [
+                {
+                    'from': CYCLE_TIME_BINS[i],
+                    'to': CYCLE_TIME_BINS[i + 1] if np.isfinite(CYCLE_TIME_BINS[i + 1]) else None,
+                    'count': int(count),
+                }
+                for i, count in enumerate(histogram)
+            ],
+        },
+        'weekly_throughput': throughput.tolist(),
+        'by_priority': by_priority,
+        'overdue_rate_by_project': overdue_rate,
+    }
+
+
+def cache_key(user):
+    """A key that changes whenever any of the user's tasks is created, edited, deleted or archived.
+
+    queryset.update() does not touch auto_now fields, so code changing tasks that way
+    must set updated_at itself, as the admin actions do, or the cached report goes stale.
+    """
+    tasks = Task.objects.filter(project__user=user).aggregate(latest=Max('updated_at'), count=Count('id'))
+    archived = ArchivedTask.objects.filter(project__user=user).count()
+    latest = tasks['latest'].timestamp() if tasks['latest'] else 0
+    return f"analytics:{user.pk}:{tasks['count']}:{latest}:{archived}"
+
+
+def get_report(user):
+    key = cache_key(user)
+    report = cache.get(key)
+    if report is None:
+        report = compute_report(load_task_arrays(user))
+        names = dict(Project.objects.filter(id__in=report['overdue_rate_by_project']).values_list('id', 'name'))
+        report['overdue_by_project'] = [
+            {'project_id': project_id, 'name': names.get(project_id, ''), 'overdue_rate': rate}
+            for project_id, rate in report.pop('overdue_rate_by_project').items()
+        ]
+        cache.set(key, report, CACHE_TIMEOUT)
+    return report
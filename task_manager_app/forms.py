@@ -1,7 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Project, Task, UserProfile
+from django.core.exceptions import ValidationError
+from .models import Project, Task, TaskDependency, UserProfile
 
 class ProjectForm(forms.ModelForm):
     class Meta:
@@ -16,14 +17,57 @@ class ProjectForm(forms.ModelForm):
 class TaskForm(forms.ModelForm):
     class Meta:
         model = Task
-        fields = ['title', 'description', 'priority', 'due_date']
+        fields = ['title', 'description', 'priority', 'due_date', 'parent']
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter task title'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Enter task description'}),
             'priority': forms.Select(attrs={'class': 'form-select'}),
             'due_date': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
+            'parent': forms.Select(attrs={'class': 'form-select'}),
         }
 
+    def __init__(self, *args, project=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if project is not None:
+            self.instance.project = project
+        # Only offer tasks from the same project that are not this task or one of its subtasks
+        parents = Task.objects.filter(project_id=self.instance.project_id)
+        if self.instance.pk:
+            parents = parents.exclude(ancestor_links__ancestor_id=self.instance.pk)
+        self.fields['parent'].queryset = parents
+        self.fields['parent'].required = False
+
+class BlockerForm(forms.Form):
+    blocked_by = forms.ModelChoiceField(
+        queryset=Task.objects.none(),
+        label='Blocked by',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+    def __init__(self, *args, task, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.task = task
+        # Other tasks of the same project that don't already block this one
+        self.fields['blocked_by'].queryset = Task.objects.filter(project_id=task.project_id).exclude(
+            pk=task.pk,
+        ).exclude(blocking__task=task).order_by('title')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('blocked_by'):
+            self.dependency = TaskDependency(task=self.task, blocked_by=cleaned_data['blocked_by'])
+            self.dependency.clean()
+        return cleaned_data
+
+    def save(self):
+        # save() repeats the cycle check under a lock, so a concurrent edit can still reject it
+        try:
+            self.dependency.save()
+        except ValidationError as error:
+            self.add_error(None, error)
+            return None
+        return self.dependency
+
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(required=True, widget=forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'Enter your email'}))
     
@@ -90,4 +134,38 @@ class UserProfileForm(forms.ModelForm):
             
             user.save()
             profile.save()
-        return profile 
\ No newline at end of file
+        return profile 
+
+class TaskFilterForm(forms.Form):
+    SORT_CHOICES = [
+        ('-created', 'Newest first'),
+        ('created', 'Oldest first'),
+        ('due', 'Due date'),
+        ('-due', 'Due date (latest first)'),
+        ('-priority', 'Priority (high first)'),
+        ('priority', 'Priority (low first)'),
+        ('title', 'Title'),
+    ]
+    COMPLETED_CHOICES = [
+        ('', 'Any'),
+        ('yes', 'Completed'),
+        ('no', 'Not completed'),
+    ]
+
+    status = forms.ChoiceField(choices=[('', 'Any status')] + Task.STATUS_CHOICES, required=False)
+    priority = forms.ChoiceField(choices=[('', 'Any priority')] + Task.PRIORITY_CHOICES, required=False)
+    project = forms.ModelChoiceField(queryset=Project.objects.none(), required=False, empty_label='All projects')
+    completed = forms.ChoiceField(choices=COMPLETED_CHOICES, required=False)
+    due_after = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    due_before = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
+
+    def __init__(self, *args, projects=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if projects is not None:
+            self.fields['project'].queryset = projects
+        for field in self.fields.values():
+            if isinstance(field.widget, forms.Select):
+                field.widget.attrs['class'] = 'form-select form-select-sm'
+            else:
+                field.widget.attrs['class'] = 'form-control form-control-sm'
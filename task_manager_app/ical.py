@@ -0,0 +1,64 @@
+"""Minimal RFC 5545 writer used by the calendar feed."""
+from datetime import timezone as dt_timezone
+
+
+def escape_text(value):
+    return (
+        value.replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def fold_line(line):
+    """Split a content line into 75-octet chunks joined by CRLF and a space."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    chunks = []
+    while encoded:
+        limit = 75 if not chunks else 74
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        chunks.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    return '\r\n '.join(chunks) + '\r\n'
+
+
+def iter_calendar(events, name, sync_token=None):
+    """Yield the calendar one event at a time so large feeds are never built in memory.
+
+    Each event is a dict with uid, summary, description, start, last_modified and an
+    optional cancelled flag.
+    """
+    yield fold_line('BEGIN:VCALENDAR')
+    yield fold_line('VERSION:2.0')
+    yield fold_line('PRODID:-//Task Manager//Due Dates//EN')
+    yield fold_line('CALSCALE:GREGORIAN')
+    yield fold_line(f'X-WR-CALNAME:{escape_text(name)}')
+    if sync_token:
+        yield fold_line(f'X-SYNC-TOKEN:{sync_token}')
+    for event in events:
+        lines = [
+            'BEGIN:VEVENT',
+            f"UID:{event['uid']}",
+            f"DTSTAMP:{format_datetime(event['last_modified'])}",
+            f"LAST-MODIFIED:{format_datetime(event['last_modified'])}",
+            f"DTSTART:{format_datetime(event['start'])}",
+            f"SUMMARY:{escape_text(event['summary'])}",
+        ]
+        if event['description']:
+            lines.append(f"DESCRIPTION:{escape_text(event['description'])}")
+        if event.get('cancelled'):
+            lines.append('STATUS:CANCELLED')
+        lines.append('END:VEVENT')
+        yield ''.join(fold_line(line) for line in lines)
+    yield fold_line('END:VCALENDAR')
@@ -0,0 +1,114 @@
+import json
+import time
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from task_manager_app.analytics import (
+    CYCLE_TIME_BINS, DAY, PERCENTILES, THROUGHPUT_WEEKS, compute_report, get_report, load_task_arrays,
+)
+from task_manager_app.models import ArchivedTask, Task
+from task_manager_app.sharding import shard_for_user, use_shard
+
+
+def _percentile(values, q):
+    """Linear interpolation, matching numpy.percentile's default."""
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def orm_report(user):
+    """The same statistics computed the straightforward way, one model instance at a time."""
+    now = timezone.now()
+    cycle_days, throughput = [], [0] * THROUGHPUT_WEEKS
+    histogram = [0] * (len(CYCLE_TIME_BINS) - 1)
+    priority_totals, priority_done, project_due, project_late = {}, {}, {}, {}
+    total = completed = 0
+
+    def record(created, finished, due, priority, project_id, done):
+        nonlocal total, completed
+        total += 1
+        priority_totals[priority] = priority_totals.get(priority, 0) + 1
+        if done:
+            completed += 1
+            priority_done[priority] = priority_done.get(priority, 0) + 1
+            days = (finished - created).total_seconds() / DAY
+            cycle_days.append(days)
+            for i in range(len(histogram)):
+                if CYCLE_TIME_BINS[i] <= days < CYCLE_TIME_BINS[i + 1]:
+                    histogram[i] += 1
+                    break
+            weeks_ago = int((now - finished).total_seconds() // (7 * DAY))
+            if 0 <= weeks_ago < THROUGHPUT_WEEKS:
+                throughput[weeks_ago] += 1
+        if due is not None:
+            project_due[project_id] = project_due.get(project_id, 0) + 1
+            if (done and finished > due) or (not done and now > due):
+                project_late[project_id] = project_late.get(project_id, 0) + 1
+
+    for task in Task.objects.filter(project__user=user):
+        record(task.created_at, task.completed_at or task.updated_at, task.due_date, task.priority, task.project_id,
+               task.is_done)
+    for archive in ArchivedTask.objects.filter(project__user=user):
+        due = archive.data['due_date']
+        record(datetime.fromisoformat(archive.data['created_at']), archive.completed_at,
+               datetime.fromisoformat(due) if due else None, archive.data['priority'], archive.project_id, True)
+
+    cycle_days.sort()
+    return {
+        'total_tasks': total,
+        'completed_tasks': completed,
+        'percentiles': [_percentile(cycle_days, p) for p in PERCENTILES],
+        'histogram': histogram,
+        'weekly_throughput': throughput,
+        'by_priority': {code: (priority_done.get(code, 0), count) for code, count in priority_totals.items()},
+        'overdue_rate_by_project': {
+            project_id: project_late.get(project_id, 0) / count * 100 for project_id, count in project_due.items()
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Print a user's productivity report, optionally timing it against a pure-ORM implementation."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--benchmark', action='store_true')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        with use_shard(shard_for_user(user)):
+            if not options['benchmark']:
+                self.stdout.write(json.dumps(get_report(user), indent=2))
+                return
+
+            def best_of(function):
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    result = function()
+                    timings.append(time.perf_counter() - started)
+                return min(timings), result
+
+            numpy_time, report = best_of(lambda: compute_report(load_task_arrays(user)))
+            orm_time, baseline = best_of(lambda: orm_report(user))
+
+        self.stdout.write(f"{report['total_tasks']} tasks ({report['completed_tasks']} completed)")
+        self.stdout.write(f'NumPy: {numpy_time * 1000:.1f} ms')
+        self.stdout.write(f'ORM:   {orm_time * 1000:.1f} ms')
+        if numpy_time:
+            self.stdout.write(f'Speedup: {orm_time / numpy_time:.1f}x')
+        if baseline['weekly_throughput'] != report['weekly_throughput'] or \
+                baseline['completed_tasks'] != report['completed_tasks']:
+            self.stdout.write(self.style.WARNING('The two implementations disagree.'))
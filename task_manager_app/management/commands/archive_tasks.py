@@ -0,0 +1,97 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from task_manager_app.models import ArchivedTask, Deadline, DeletedTask, Task, TaskClosure, TaskDependency
+from task_manager_app.sharding import get_shards
+
+MEASURED_MODELS = (Task, Deadline, TaskClosure, TaskDependency, ArchivedTask, DeletedTask)
+
+
+def table_bytes(alias, models=MEASURED_MODELS):
+    """Bytes used by the tables of ``models`` and their indexes, or None if the database can't say."""
+    connection = connections[alias]
+    tables = [model._meta.db_table for model in models]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT SUM(pg_total_relation_size(name::regclass)) FROM unnest(%s) AS name', [tables])
+        elif connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(tables))
+            try:
+                cursor.execute(
+                    'SELECT SUM(d.pgsize) FROM dbstat d INNER JOIN sqlite_master m ON m.name = d.name '
+                    f'WHERE m.tbl_name IN ({placeholders})',
+                    tables,
+                )
+            except DatabaseError:
+                # SQLite built without the dbstat virtual table
+                return None
+        else:
+            return None
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = 'Move tasks completed more than --days ago, with their deadlines, into the archive table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Only archive tasks completed at least this many days ago')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be archived without changing anything')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        for alias in get_shards():
+            # Leaves only: archiving a parent would cascade-delete its remaining subtasks.
+            # Parents become leaves once their subtasks are archived, so later batches pick them up.
+            candidates = Task.objects.using(alias).filter(
+                Task.done_filter(),
+                completed_at__lt=cutoff,
+            ).exclude(Exists(Task.objects.filter(parent=OuterRef('pk'))))
+
+            if options['dry_run']:
+                self.stdout.write(f'{alias}: {candidates.count()} tasks would be archived.')
+                continue
+
+            archived = 0
+            removed = Counter()
+            size_before = table_bytes(alias)
+            while True:
+                tasks = list(
+                    candidates.select_related('deadline').prefetch_related('dependencies', 'blocking')
+                    .order_by('pk')[:batch_size]
+                )
+                if not tasks:
+                    break
+                with transaction.atomic(using=alias):
+                    # Skip any task that gained a subtask since it was selected
+                    still_leaves = set(candidates.filter(pk__in=[task.pk for task in tasks]).values_list('pk', flat=True))
+                    tasks = [task for task in tasks if task.pk in still_leaves]
+                    archives = [ArchivedTask.from_task(task) for task in tasks]
+                    ArchivedTask.objects.using(alias).bulk_create(archives)
+                    _, deleted = Task.objects.using(alias).filter(pk__in=still_leaves).delete()
+                removed.update(deleted)
+                archived += len(tasks)
+
+            self.stdout.write(self.style.SUCCESS(f'{alias}: archived {archived} tasks.'))
+            size_after = table_bytes(alias)
+            if size_before is None or size_after is None:
+                self.stdout.write(f'  Table sizes cannot be measured on {connections[alias].vendor}.')
+            else:
+                # Measured, not estimated. Freed pages are reused by new rows but only returned
+                # to the operating system by VACUUM (VACUUM FULL on PostgreSQL).
+                self.stdout.write(
+                    f'  Task and archive tables: {size_before / 1024:.1f} KB before, {size_after / 1024:.1f} KB after '
+                    f'({(size_before - size_after) / 1024:+.1f} KB); run VACUUM to return freed space to the OS.'
+                )
+            for label, count in sorted(removed.items()):
+                self.stdout.write(f'  {label}: {count} rows removed')
+            # Calendar feeds can't sync past this point any more; they fetch the full feed instead
+            expired = DeletedTask.objects.using(alias).filter(deleted_at__lt=timezone.now() - DeletedTask.KEEP_FOR)
+            pruned, _ = expired.delete()
+            self.stdout.write(f'  {pruned} deletion records older than {DeletedTask.KEEP_FOR.days} days removed')
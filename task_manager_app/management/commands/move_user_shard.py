@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from task_manager_app.sharding import get_shards, move_user
+
+
+class Command(BaseCommand):
+    help = "Move a user's projects, tasks and deadlines to another shard database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('shard', help='Target database alias')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+        if options['shard'] not in get_shards():
+            raise CommandError(f"Unknown shard '{options['shard']}'. Configured shards: {', '.join(get_shards())}.")
+        move_user(user, options['shard'], batch_size=options['batch_size'], log=self.stdout.write)
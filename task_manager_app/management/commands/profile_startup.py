@@ -0,0 +1,158 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+
+WSGI_MODULE = 'task_manager.wsgi'
+
+# Runs in a fresh interpreter: load the WSGI app, optionally warm it up, then time
+# two requests made straight through the WSGI callable
+FIRST_REQUEST_SCRIPT = '''
+import io, json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+path, host, cookie, warm = sys.argv[1:]
+started = time.perf_counter()
+from task_manager.wsgi import application
+loaded = time.perf_counter()
+if warm == '1':
+    from task_manager_app.warmup import warmup
+    warmup()
+ready = time.perf_counter()
+
+def request():
+    environ = {'PATH_INFO': path, 'HTTP_HOST': host, 'wsgi.input': io.BytesIO()}
+    if cookie:
+        environ['HTTP_COOKIE'] = cookie
+    setup_testing_defaults(environ)
+    statuses = []
+    began = time.perf_counter()
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(response)
+    response.close()
+    return time.perf_counter() - began, statuses[0]
+
+first, status = request()
+second, _ = request()
+print(json.dumps({
+    'load': loaded - started, 'warmup': ready - loaded,
+    'first': first, 'second': second, 'status': status,
+}))
+'''
+
+
+def parse_importtime(stderr):
+    """Turn ``-X importtime`` output into (module, self_us, cumulative_us) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        rows.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        f'Profile how long {WSGI_MODULE} takes to import and set up, per module, and benchmark '
+        'time-to-first-request of a fresh worker with and without warmup.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Number of slowest modules to list')
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes to start per benchmark')
+        parser.add_argument('--path', default='/', help='URL to request')
+        parser.add_argument('--username', help='Make the requests logged in as this user')
+        parser.add_argument('--skip-imports', action='store_true')
+        parser.add_argument('--skip-benchmark', action='store_true')
+
+    def run_python(self, *args):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'task_manager.settings')}
+        result = subprocess.run(
+            [sys.executable, *args], capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        if result.returncode:
+            raise CommandError(f'Child process failed:\n{result.stderr[-2000:]}')
+        return result
+
+    def handle(self, *args, **options):
+        if not options['skip_imports']:
+            self.report_imports(options['top'])
+        if not options['skip_benchmark']:
+            self.benchmark(options)
+
+    def report_imports(self, top):
+        # Importing the WSGI module runs django.setup(), so app and model imports are included
+        rows = parse_importtime(self.run_python('-X', 'importtime', '-c', f'import {WSGI_MODULE}').stderr)
+        if not rows:
+            raise CommandError('No import timings were reported.')
+        total = sum(own for _, own, _ in rows)
+        by_package = defaultdict(int)
+        for module, own, _ in rows:
+            by_package[module.split('.')[0]] += own
+
+        # The WSGI module's own time is what django.setup() spends outside of imports
+        setup = next(own for module, own, _ in rows if module == WSGI_MODULE)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Importing {WSGI_MODULE}: {total / 1000:.1f} ms'))
+        self.stdout.write(f'django.setup() outside imports: {setup / 1000:.1f} ms')
+        self.stdout.write('By top-level package (self time):')
+        for package, own in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f'  {own / 1000:9.1f} ms  {package}')
+        self.stdout.write(f'Slowest {top} modules:')
+        self.stdout.write(f"  {'self':>9}     {'cumulative':>10}     module")
+        for module, own, cumulative in sorted(rows, key=lambda row: -row[1])[:top]:
+            self.stdout.write(f'  {own / 1000:9.1f} ms  {cumulative / 1000:10.1f} ms  {module}')
+
+    def login_cookie(self, username):
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"User '{username}' does not exist.")
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session, f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def benchmark(self, options):
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        session, cookie = self.login_cookie(options['username']) if options['username'] else (None, '')
+        try:
+            results = {}
+            for label, warm in (('cold', '0'), ('warmed', '1')):
+                runs = [
+                    json.loads(self.run_python('-c', FIRST_REQUEST_SCRIPT, options['path'], host, cookie, warm).stdout)
+                    for _ in range(options['runs'])
+                ]
+                results[label] = {key: statistics.median(run[key] for run in runs)
+                                  for key in ('load', 'warmup', 'first', 'second')}
+                results[label]['status'] = runs[-1]['status']
+        finally:
+            if session is not None:
+                session.delete()
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"First request to {options['path']} ({results['cold']['status']}), "
+            f"median of {options['runs']} fresh processes:"
+        ))
+        self.stdout.write(f"  {'':8}{'load':>10}{'warmup':>10}{'1st req':>10}{'2nd req':>10}")
+        for label, timing in results.items():
+            self.stdout.write(
+                f'  {label:8}' + ''.join(
+                    f'{timing[key] * 1000:8.1f}ms' for key in ('load', 'warmup', 'first', 'second')
+                )
+            )
+        saved = results['cold']['first'] - results['warmed']['first']
+        self.stdout.write(f'Warmup takes {saved * 1000:.1f} ms off the first request.')
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from task_manager_app.models import ArchivedTask, Project, ProjectSnapshot, SnapshotRun, Task
+from task_manager_app.sharding import get_shards
+
+DONE = Task.done_filter()
+
+
+class Command(BaseCommand):
+    help = "Record today's task counts for every project that changed since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Snapshot every project, not just changed ones')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def changed_projects(self, alias, since, now):
+        tasks = Task.objects.using(alias)
+        changed = set(tasks.filter(updated_at__gte=since).values_list('project_id', flat=True).distinct())
+        # Deleting a task touches its project
+        changed.update(Project.objects.using(alias).filter(updated_at__gte=since).values_list('id', flat=True))
+        # Overdue counts change with the clock, not with edits
+        changed.update(
+            tasks.filter(due_date__gt=since, due_date__lte=now).exclude(DONE)
+            .values_list('project_id', flat=True).distinct()
+        )
+        return sorted(changed)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for alias in get_shards():
+            now = timezone.now()
+            today = timezone.localdate(now)
+            last_run = SnapshotRun.objects.using(alias).first()
+            if last_run is None or options['full']:
+                project_ids = list(Project.objects.using(alias).order_by('id').values_list('id', flat=True))
+            else:
+                project_ids = self.changed_projects(alias, last_run.started_at, now)
+
+            for start in range(0, len(project_ids), batch_size):
+                batch = project_ids[start:start + batch_size]
+                counts = {
+                    row['project_id']: row for row in
+                    Task.objects.using(alias).filter(project_id__in=batch).values('project_id').annotate(
+                        done=Count('id', filter=DONE),
+                        in_progress=Count('id', filter=Q(status='P') & ~DONE),
+                        todo=Count('id', filter=~Q(status='P') & ~DONE),
+                        overdue=Count('id', filter=Q(due_date__lt=now) & ~DONE),
+                    ).order_by()
+                }
+                archived = dict(
+                    ArchivedTask.objects.using(alias).filter(project_id__in=batch)
+                    .values_list('project_id').annotate(Count('id')).order_by()
+                )
+                snapshots = []
+                for project_id in batch:
+                    row = counts.get(project_id, {})
+                    snapshots.append(ProjectSnapshot(
+                        project_id=project_id,
+                        date=today,
+                        todo_count=row.get('todo', 0),
+                        in_progress_count=row.get('in_progress', 0),
+                        done_count=row.get('done', 0) + archived.get(project_id, 0),
+                        overdue_count=row.get('overdue', 0),
+                        updated_at=now,
+                    ))
+                ProjectSnapshot.objects.using(alias).bulk_create(
+                    snapshots,
+                    update_conflicts=True,
+                    unique_fields=['project', 'date'],
+                    update_fields=['todo_count', 'in_progress_count', 'done_count', 'overdue_count', 'updated_at'],
+                )
+
+            SnapshotRun.objects.using(alias).create(started_at=now, projects_updated=len(project_ids))
+            self.stdout.write(self.style.SUCCESS(f'{alias}: snapshot {len(project_ids)} projects for {today}.'))
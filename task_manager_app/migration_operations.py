@@ -0,0 +1,67 @@
+"""Migration operations for the sharded schema.
+
+auth_user only exists on the default database (see sharding.ShardRouter), so on
+the shards a foreign key to it has nothing to reference. PostgreSQL refuses to
+create one, and SQLite fails every write to the table.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.migrations.operations.base import Operation
+
+
+def _without_user_constraints(app_label, state):
+    """A copy of ``state`` whose foreign keys to the user model have db_constraint=False."""
+    state = state.clone()
+    for (label, _), model_state in state.models.items():
+        if label != app_label:
+            continue
+        for name, field in model_state.fields.items():
+            target = getattr(field.remote_field, 'model', None)
+            if isinstance(target, str) and target.lower() == settings.AUTH_USER_MODEL.lower():
+                _, _, args, kwargs = field.deconstruct()
+                model_state.fields[name] = field.__class__(*args, **{**kwargs, 'db_constraint': False})
+    # Render the models again from the changed fields
+    state.__dict__.pop('apps', None)
+    return state
+
+
+class WithoutUserConstraintOnShards(Operation):
+    """Run ``operation``, leaving out its foreign key constraints to the user model on shards."""
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def deconstruct(self):
+        return self.__class__.__name__, [self.operation], {}
+
+    @property
+    def reversible(self):
+        return self.operation.reversible
+
+    def state_forwards(self, app_label, state):
+        self.operation.state_forwards(app_label, state)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.alias != DEFAULT_DB_ALIAS:
+            from_state = _without_user_constraints(app_label, from_state)
+            to_state = _without_user_constraints(app_label, to_state)
+        self.operation.database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.alias != DEFAULT_DB_ALIAS:
+            from_state = _without_user_constraints(app_label, from_state)
+            to_state = _without_user_constraints(app_label, to_state)
+        self.operation.database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def references_model(self, name, app_label):
+        return self.operation.references_model(name, app_label)
+
+    def references_field(self, model_name, name, app_label):
+        return self.operation.references_field(model_name, name, app_label)
+
+    def describe(self):
+        return f'{self.operation.describe()} (no user foreign key constraint on shards)'
+
+    @property
+    def migration_name_fragment(self):
+        return self.operation.migration_name_fragment
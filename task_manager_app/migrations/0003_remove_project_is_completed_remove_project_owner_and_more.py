@@ -4,6 +4,8 @@ import django.db.models.deletion
 from django.conf import settings
 from django.db import migrations, models
 
+from task_manager_app.migration_operations import WithoutUserConstraintOnShards
+
 
 class Migration(migrations.Migration):
 
@@ -26,10 +28,12 @@ class Migration(migrations.Migration):
             name='status',
             field=models.CharField(choices=[('not_started', 'Not Started'), ('in_progress', 'In Progress'), ('completed', 'Completed')], default='not_started', max_length=20),
         ),
-        migrations.AddField(
-            model_name='project',
-            name='user',
-            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='projects', to=settings.AUTH_USER_MODEL),
+        WithoutUserConstraintOnShards(
+            migrations.AddField(
+                model_name='project',
+                name='user',
+                field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='projects', to=settings.AUTH_USER_MODEL),
+            ),
         ),
         migrations.AlterField(
             model_name='project',
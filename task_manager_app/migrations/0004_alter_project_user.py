@@ -4,6 +4,8 @@ import django.db.models.deletion
 from django.conf import settings
 from django.db import migrations, models
 
+from task_manager_app.migration_operations import WithoutUserConstraintOnShards
+
 
 class Migration(migrations.Migration):
 
@@ -13,10 +15,12 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.AlterField(
-            model_name='project',
-            name='user',
-            field=models.ForeignKey(default=3, on_delete=django.db.models.deletion.CASCADE, related_name='projects', to=settings.AUTH_USER_MODEL),
-            preserve_default=False,
+        WithoutUserConstraintOnShards(
+            migrations.AlterField(
+                model_name='project',
+                name='user',
+                field=models.ForeignKey(default=3, on_delete=django.db.models.deletion.CASCADE, related_name='projects', to=settings.AUTH_USER_MODEL),
+                preserve_default=False,
+            ),
         ),
     ]
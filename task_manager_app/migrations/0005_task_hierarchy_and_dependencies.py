@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_self_links(apps, schema_editor):
+    Task = apps.get_model('task_manager_app', 'Task')
+    TaskClosure = apps.get_model('task_manager_app', 'TaskClosure')
+    db_alias = schema_editor.connection.alias
+    batch = []
+    for task_id in Task.objects.using(db_alias).values_list('id', flat=True).iterator():
+        batch.append(TaskClosure(ancestor_id=task_id, descendant_id=task_id, depth=0))
+        if len(batch) >= 1000:
+            TaskClosure.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    TaskClosure.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_manager_app', '0004_alter_project_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subtasks', to='task_manager_app.task'),
+        ),
+        migrations.CreateModel(
+            name='TaskDependency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('blocked_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocking', to='task_manager_app.task')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependencies', to='task_manager_app.task')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TaskClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='task_manager_app.task')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='task_manager_app.task')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='taskdependency',
+            constraint=models.UniqueConstraint(fields=('task', 'blocked_by'), name='unique_task_dependency'),
+        ),
+        migrations.AddIndex(
+            model_name='taskclosure',
+            index=models.Index(fields=['descendant', 'ancestor'], name='task_manage_descend_826859_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='taskclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_task_closure'),
+        ),
+        migrations.RunPython(create_self_links, migrations.RunPython.noop),
+    ]
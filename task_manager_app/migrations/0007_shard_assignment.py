@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def assign_existing_users(apps, schema_editor):
+    # Everything created before sharding lives on the default database
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    ShardAssignment = apps.get_model('task_manager_app', 'ShardAssignment')
+    db_alias = schema_editor.connection.alias
+    ShardAssignment.objects.using(db_alias).bulk_create(
+        [ShardAssignment(user_id=user_id, shard='default') for user_id in User.objects.using(db_alias).values_list('id', flat=True)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task_manager_app', '0006_calendar_feed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='projects', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='ShardAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.CharField(max_length=100)),
+                ('locked', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='shard_assignment', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(assign_existing_users, migrations.RunPython.noop, hints={'model_name': 'shardassignment'}),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_manager_app', '0007_shard_assignment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField()),
+                ('completed_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to='task_manager_app.project')),
+            ],
+            options={
+                'ordering': ['-completed_at'],
+                'indexes': [models.Index(fields=['project', 'completed_at'], name='task_manage_project_1ef9b8_idx')],
+            },
+        ),
+    ]
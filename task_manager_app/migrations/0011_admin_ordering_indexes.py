@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_manager_app', '0010_task_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deadline',
+            index=models.Index(fields=['updated_at'], name='task_manage_updated_e607d6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['updated_at'], name='task_manage_updated_b9a316_idx'),
+        ),
+    ]
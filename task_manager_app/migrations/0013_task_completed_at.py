@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:12
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def backfill_completed_at(apps, schema_editor):
+    # The last update is the closest record of when existing done tasks were completed
+    Task = apps.get_model('task_manager_app', 'Task')
+    Task.objects.using(schema_editor.connection.alias).filter(
+        Q(status='D') | Q(is_completed=True),
+    ).update(completed_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_manager_app', '0012_id_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['completed_at'], name='task_manage_complet_e3187f_idx'),
+        ),
+    ]
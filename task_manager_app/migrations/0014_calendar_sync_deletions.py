@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task_manager_app', '0013_task_completed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='deadline',
+            index=models.Index(fields=['original_due_date'], name='task_manage_origina_04405b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deadline',
+            index=models.Index(fields=['extended_due_date'], name='task_manage_extende_9e899b_idx'),
+        ),
+        migrations.AddField(
+            model_name='deletedtask',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='deletedtask',
+            index=models.Index(fields=['user', 'deleted_at'], name='task_manage_user_id_b3f470_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedtask',
+            index=models.Index(fields=['deleted_at'], name='task_manage_deleted_a9f08e_idx'),
+        ),
+    ]
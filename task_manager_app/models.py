@@ -1,7 +1,13 @@
-from django.db import models
+import secrets
+from datetime import datetime, timedelta
+
+from django.db import models, router, transaction
+from django.db.models import DEFERRED, Count, Q
+from django.db.models.expressions import RawSQL
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
 # Create your models here.
@@ -10,10 +16,17 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='userprofile')
     profile_picture = models.ImageField(upload_to='profile_pics/', null=True, blank=True)
     bio = models.TextField(max_length=500, blank=True)
+    calendar_token = models.CharField(max_length=64, unique=True, null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+    def get_calendar_token(self):
+        if not self.calendar_token:
+            self.calendar_token = secrets.token_urlsafe(32)
+            self.save(update_fields=['calendar_token'])
+        return self.calendar_token
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -23,6 +36,38 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     instance.userprofile.save()
 
+class ShardAssignment(models.Model):
+    """Directory row saying which database holds a user's projects, tasks and deadlines."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='shard_assignment')
+    shard = models.CharField(max_length=100)
+    locked = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} on {self.shard}"
+
+class IdSequence(models.Model):
+    """Next free primary key of a sharded table, shared by every shard (see sharding.allocate_id)."""
+    name = models.CharField(max_length=100, unique=True)
+    next_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.next_id}"
+
+@receiver(post_save, sender=User)
+def assign_user_shard(sender, instance, created, **kwargs):
+    if created:
+        from .sharding import pick_shard
+        ShardAssignment.objects.create(user=instance, shard=pick_shard())
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_data(sender, instance, **kwargs):
+    # The delete cascade only follows relations on the user's own database
+    from .sharding import shard_for_user
+    shard = shard_for_user(instance)
+    Project.objects.using(shard).filter(user=instance).delete()
+    DeletedTask.objects.using(shard).filter(user=instance).delete()
+
 class Project(models.Model):
     STATUS_CHOICES = [
         ('not_started', 'Not Started'),
@@ -32,7 +77,8 @@ class Project(models.Model):
     
     name = models.CharField(max_length=200)
     description = models.TextField()
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='projects')
+    # Projects can live on a different database than auth_user (see sharding.py)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='projects', db_constraint=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='not_started')
@@ -40,8 +86,18 @@ class Project(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            from .sharding import allocate_id
+            self.pk = allocate_id(Project)
+            kwargs.setdefault('force_insert', True)
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
 
 class Task(models.Model):
     PRIORITY_CHOICES = [
@@ -58,24 +114,432 @@ class Task(models.Model):
     
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='tasks')
+    # Indexed by the composite (project, ...) indexes in Meta
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='tasks', db_index=False)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subtasks')
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='T')
     priority = models.CharField(max_length=1, choices=PRIORITY_CHOICES, default='M')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     due_date = models.DateTimeField(null=True, blank=True)
     is_completed = models.BooleanField(default=False)
+    # When the task last became done; set by save(), cleared when it is reopened
+    completed_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return f"{self.title} ({self.get_status_display()})"
+
+    @property
+    def is_done(self):
+        return self.status == 'D' or self.is_completed
+
+    @staticmethod
+    def done_filter(prefix=''):
+        """The query form of is_done; ``prefix`` is the lookup path to the tasks, e.g. 'tasks__'."""
+        return Q(**{f'{prefix}status': 'D'}) | Q(**{f'{prefix}is_completed': True})
+
+    def set_done(self, done):
+        """Complete or reopen the task, keeping status and is_completed in agreement."""
+        self.is_completed = done
+        if done:
+            self.status = 'D'
+        elif self.status == 'D':
+            self.status = 'T'
     
     def is_overdue(self):
         if self.due_date:
             return timezone.now() > self.due_date
         return False
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored parent so save() only rewrites closure rows on a move
+        instance._loaded_parent_id = instance.__dict__.get('parent_id', DEFERRED)
+        return instance
+
+    def clean(self):
+        super().clean()
+        self._check_parent(self._state.db)
+
+    def _check_parent(self, using):
+        if not self.parent_id:
+            return
+        parent_project_id = Task.objects.using(using).filter(pk=self.parent_id).values_list('project_id', flat=True).first()
+        if parent_project_id != self.project_id:
+            raise ValidationError({'parent': 'A subtask must belong to the same project as its parent.'})
+        if self.pk and TaskClosure.objects.using(using).filter(ancestor_id=self.pk, descendant_id=self.parent_id).exists():
+            raise ValidationError({'parent': 'A task cannot be a subtask of itself or of one of its subtasks.'})
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(Task, instance=self)
+        is_new = self._state.adding
+        if self.pk is None:
+            from .sharding import allocate_id
+            self.pk = allocate_id(Task)
+            kwargs.setdefault('force_insert', True)
+        if self.is_done != (self.completed_at is not None):
+            self.completed_at = timezone.now() if self.is_done else None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'completed_at'}
+        with transaction.atomic(using=using):
+            loaded_parent_id = getattr(self, '_loaded_parent_id', DEFERRED)
+            if not is_new and loaded_parent_id is DEFERRED:
+                loaded_parent_id = Task.objects.using(using).filter(pk=self.pk).values_list('parent_id', flat=True).first()
+            parent_changed = not is_new and loaded_parent_id != self.parent_id
+            if parent_changed or (is_new and self.parent_id):
+                # Two concurrent moves (A under B, B under A) would each pass the check and
+                # close a cycle, so lock the project's tree as TaskDependency.save() does
+                Project.objects.using(using).select_for_update().filter(pk=self.project_id).first()
+                self._check_parent(using)
+            super().save(*args, **kwargs)
+            if is_new:
+                self._insert_closure(using)
+            elif parent_changed:
+                self._move_closure(using)
+        self._loaded_parent_id = self.parent_id
+
+    def _insert_closure(self, using):
+        links = [TaskClosure(ancestor_id=self.pk, descendant_id=self.pk, depth=0)]
+        if self.parent_id:
+            ancestors = TaskClosure.objects.using(using).filter(descendant_id=self.parent_id).values_list('ancestor_id', 'depth')
+            links += [
+                TaskClosure(ancestor_id=ancestor_id, descendant_id=self.pk, depth=depth + 1)
+                for ancestor_id, depth in ancestors
+            ]
+        TaskClosure.objects.using(using).bulk_create(links)
+
+    def _move_closure(self, using):
+        closure = TaskClosure.objects.using(using)
+        subtree = list(closure.filter(ancestor_id=self.pk).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        # Detach the subtree from its old ancestors, keeping its internal links
+        closure.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+        if self.parent_id:
+            ancestors = closure.filter(descendant_id=self.parent_id).values_list('ancestor_id', 'depth')
+            closure.bulk_create([
+                TaskClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + depth + 1)
+                for ancestor_id, ancestor_depth in ancestors
+                for descendant_id, depth in subtree
+            ])
+
+    def get_descendants(self):
+        """All subtasks at any depth, in one query against the closure table."""
+        return Task.objects.using(self._state.db).filter(ancestor_links__ancestor_id=self.pk, ancestor_links__depth__gt=0)
+
+    def get_ancestors(self):
+        return Task.objects.using(self._state.db).filter(
+            descendant_links__descendant_id=self.pk, descendant_links__depth__gt=0,
+        )
+
+    def get_transitive_blockers(self):
+        """All tasks this one waits on, directly or indirectly, via a recursive CTE."""
+        table = TaskDependency._meta.db_table
+        sql = (
+            f'WITH RECURSIVE blockers(id) AS ('
+            f'SELECT blocked_by_id FROM {table} WHERE task_id = %s '
+            f'UNION '
+            f'SELECT d.blocked_by_id FROM {table} d INNER JOIN blockers b ON d.task_id = b.id'
+            f') SELECT id FROM blockers'
+        )
+        return Task.objects.using(self._state.db).filter(id__in=RawSQL(sql, (self.pk,)))
+
+    def is_unblocked(self):
+        return not self.get_transitive_blockers().exclude(Task.done_filter()).exists()
+
+    @classmethod
+    def blocked_in_project(cls, project_id):
+        """The project's tasks that wait on an unfinished task, directly or indirectly, in one query."""
+        dependencies, tasks = TaskDependency._meta.db_table, cls._meta.db_table
+        sql = (
+            f'WITH RECURSIVE reach(task_id, blocker_id) AS ('
+            f'SELECT d.task_id, d.blocked_by_id FROM {dependencies} d '
+            f'INNER JOIN {tasks} t ON t.id = d.task_id WHERE t.project_id = %s '
+            f'UNION '
+            f'SELECT r.task_id, d.blocked_by_id FROM reach r INNER JOIN {dependencies} d ON d.task_id = r.blocker_id'
+            # Not done, as in Task.is_done
+            f') SELECT r.task_id FROM reach r INNER JOIN {tasks} b ON b.id = r.blocker_id '
+            f"WHERE NOT (b.status = 'D' OR b.is_completed)"
+        )
+        return cls.objects.filter(id__in=RawSQL(sql, (project_id,)))
+
+    def add_blocker(self, blocker):
+        return TaskDependency.objects.using(self._state.db).create(task=self, blocked_by=blocker)
+
+    def get_progress(self):
+        """Completion percentage rolled up from all subtasks, or this task alone if it has none."""
+        totals = self.get_descendants().aggregate(
+            total=Count('id'),
+            completed=Count('id', filter=Task.done_filter()),
+        )
+        if not totals['total']:
+            return 100 if self.is_done else 0
+        return totals['completed'] / totals['total'] * 100
+
     class Meta:
         ordering = ['-updated_at']
+        # Every index is paid for on each task write, so keep only ones a query needs.
+        # Status, priority and completion filters go without: the task list's facet
+        # counts read all of the user's tasks anyway, and the priority sort is a CASE
+        # expression no plain index can serve.
+        indexes = [
+            # Calendar feed and due-date filters
+            models.Index(fields=['project', 'due_date']),
+            # Project page order and the conditional-GET validators
+            models.Index(fields=['project', 'updated_at']),
+            # Task list default sort and recent tasks
+            models.Index(fields=['project', 'created_at']),
+            # Cross-project scans of recent changes and newly overdue tasks (snapshot_progress)
+            models.Index(fields=['updated_at']),
+            models.Index(fields=['due_date']),
+            # Oldest completions first (archive_tasks)
+            models.Index(fields=['completed_at']),
+        ]
+
+
+@receiver(post_delete, sender=Task)
+def touch_project_on_task_delete(sender, instance, origin=None, **kwargs):
+    # A deleted task leaves no updated_at behind, so mark its project as changed for
+    # snapshot_progress and the page validators. Project deletes cascade here too; skip them.
+    if isinstance(origin, Project) or getattr(origin, 'model', None) is Project:
+        return
+    # One UPDATE per project however many of its tasks a single delete() removes
+    touched = origin.__dict__.setdefault('_touched_project_ids', set()) if origin is not None else set()
+    if instance.project_id in touched:
+        return
+    touched.add(instance.project_id)
+    Project.objects.using(instance._state.db).filter(pk=instance.project_id).update(updated_at=timezone.now())
+
+
+class DeletedTask(models.Model):
+    """Left behind by a deleted or archived task, so calendar feed syncs can cancel its event."""
+    # auth_user lives on the default database, so no constraint
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+    task_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    # Pruned by archive_tasks; older sync tokens must fetch the full feed again
+    KEEP_FOR = timedelta(days=90)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at']),
+            models.Index(fields=['deleted_at']),
+        ]
+
+
+@receiver(pre_delete, sender=Task)
+def collect_deleted_task(sender, instance, origin=None, **kwargs):
+    # Every pre_delete of a delete() is sent before its first post_delete, which then
+    # writes all of the tombstones in one INSERT
+    if origin is not None:
+        origin.__dict__.setdefault('_deleted_tasks', []).append((instance.pk, instance.project_id))
+
+
+@receiver(post_delete, sender=Task)
+def record_deleted_tasks(sender, instance, origin=None, **kwargs):
+    deleted = origin.__dict__.pop('_deleted_tasks', None) if origin is not None else None
+    if not deleted:
+        return
+    using = instance._state.db
+    owners = dict(
+        Project.objects.using(using).filter(pk__in={project_id for _, project_id in deleted}).values_list('pk', 'user_id')
+    )
+    DeletedTask.objects.using(using).bulk_create([
+        DeletedTask(user_id=owners[project_id], task_id=task_id)
+        for task_id, project_id in deleted if project_id in owners
+    ])
+
+
+class ArchivedTask(models.Model):
+    """A completed task moved out of the Task table, stored as one compact JSON document."""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='archived_tasks')
+    original_id = models.BigIntegerField()
+    completed_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField()
+
+    def __str__(self):
+        return self.data['title']
+
+    @classmethod
+    def from_task(cls, task):
+        data = {
+            'title': task.title,
+            'description': task.description,
+            'status': task.status,
+            'priority': task.priority,
+            'is_completed': task.is_completed,
+            'parent_id': task.parent_id,
+            'created_at': task.created_at.isoformat(),
+            'due_date': task.due_date.isoformat() if task.due_date else None,
+            # The delete cascade drops the task's dependency rows; keep both directions
+            'blocked_by': [dependency.blocked_by_id for dependency in task.dependencies.all()],
+            'blocking': [dependency.task_id for dependency in task.blocking.all()],
+        }
+        try:
+            deadline = task.deadline
+        except Deadline.DoesNotExist:
+            pass
+        else:
+            data['deadline'] = {
+                'original_due_date': deadline.original_due_date.isoformat(),
+                'extended_due_date': deadline.extended_due_date.isoformat() if deadline.extended_due_date else None,
+                'extension_reason': deadline.extension_reason,
+            }
+        return cls(
+            project_id=task.project_id, original_id=task.pk, completed_at=task.completed_at or task.updated_at, data=data,
+        )
+
+    def restore(self):
+        """Put the task back into the Task table under its old id and drop the archive entry."""
+        data = self.data
+        parse = datetime.fromisoformat
+        using = self._state.db
+        with transaction.atomic(using=using):
+            task = Task(
+                # Ids are never reused (see sharding.allocate_id), so links to the task work again
+                pk=self.original_id,
+                project_id=self.project_id,
+                title=data['title'],
+                description=data['description'],
+                status=data['status'],
+                priority=data['priority'],
+                is_completed=data['is_completed'],
+                due_date=parse(data['due_date']) if data['due_date'] else None,
+                completed_at=self.completed_at,
+            )
+            parent_id = data.get('parent_id')
+            if parent_id and Task.objects.using(using).filter(pk=parent_id, project_id=self.project_id).exists():
+                task.parent_id = parent_id
+            task.save(using=using, force_insert=True)
+            Task.objects.using(using).filter(pk=task.pk).update(created_at=parse(data['created_at']))
+            deadline = data.get('deadline')
+            if deadline:
+                Deadline.objects.using(using).create(
+                    task=task,
+                    original_due_date=parse(deadline['original_due_date']),
+                    extended_due_date=parse(deadline['extended_due_date']) if deadline['extended_due_date'] else None,
+                    extension_reason=deadline['extension_reason'],
+                )
+            self._restore_dependencies(task)
+            self.delete()
+        return task
+
+    def _restore_dependencies(self, task):
+        data = self.data
+        links = [(task.pk, other) for other in data.get('blocked_by', [])]
+        links += [(other, task.pk) for other in data.get('blocking', [])]
+        using = self._state.db
+        existing = set(Task.objects.using(using).filter(
+            project_id=self.project_id, pk__in=[other for pair in links for other in pair],
+        ).values_list('pk', flat=True))
+        for task_id, blocked_by_id in links:
+            if task_id not in existing or blocked_by_id not in existing:
+                continue
+            try:
+                TaskDependency.objects.using(using).create(task_id=task_id, blocked_by_id=blocked_by_id)
+            except ValidationError:
+                # Dependencies added since archiving would now make this one a cycle
+                pass
+
+    class Meta:
+        ordering = ['-completed_at']
+        indexes = [
+            models.Index(fields=['project', 'completed_at']),
+        ]
+
+
+class ProjectSnapshot(models.Model):
+    """Task counts for a project at the end of a day, written by the snapshot_progress command.
+
+    A day only gets a row when something in the project changed, so readers carry the
+    previous row forward over missing days.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='snapshots')
+    date = models.DateField()
+    todo_count = models.PositiveIntegerField(default=0)
+    in_progress_count = models.PositiveIntegerField(default=0)
+    done_count = models.PositiveIntegerField(default=0)
+    overdue_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.project.name} on {self.date}"
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'date'], name='unique_project_snapshot'),
+        ]
+
+
+class SnapshotRun(models.Model):
+    started_at = models.DateTimeField()
+    projects_updated = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started_at']
+
+
+class TaskClosure(models.Model):
+    """One row per (ancestor, descendant) pair in the subtask tree, including self-links at depth 0."""
+    ancestor = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_task_closure'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'ancestor']),
+        ]
+
+
+class TaskDependency(models.Model):
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='dependencies')
+    blocked_by = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='blocking')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.task.title} blocked by {self.blocked_by.title}"
+
+    def clean(self):
+        super().clean()
+        self._check_edge(self._state.db)
+
+    def _check_edge(self, using):
+        if self.task_id == self.blocked_by_id:
+            raise ValidationError('A task cannot block itself.')
+        tasks = Task.objects.using(using).in_bulk([self.task_id, self.blocked_by_id])
+        task, blocker = tasks.get(self.task_id), tasks.get(self.blocked_by_id)
+        if task is None or blocker is None or task.project_id != blocker.project_id:
+            raise ValidationError('A task can only be blocked by tasks in the same project.')
+        if blocker.get_transitive_blockers().filter(pk=self.task_id).exists():
+            raise ValidationError('This dependency would create a cycle.')
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(TaskDependency, instance=self)
+        with transaction.atomic(using=using):
+            if self._state.adding:
+                # Locking only the two tasks would let concurrent inserts of different edges
+                # of a longer cycle each miss the others, so lock the whole project's graph
+                project_id = Task.objects.using(using).filter(pk=self.task_id).values('project_id')
+                Project.objects.using(using).select_for_update().filter(pk__in=project_id).first()
+                self._check_edge(using)
+            super().save(*args, **kwargs)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'blocked_by'], name='unique_task_dependency'),
+        ]
+
+@receiver(post_save, sender=TaskDependency)
+@receiver(post_delete, sender=TaskDependency)
+def touch_blocked_task(sender, instance, **kwargs):
+    # Pages validated by updated_at (see views.conditional_page) show the blockers
+    Task.objects.using(instance._state.db).filter(pk=instance.task_id).update(updated_at=timezone.now())
 
 class Deadline(models.Model):
     task = models.OneToOneField(Task, on_delete=models.CASCADE, related_name='deadline')
@@ -96,3 +560,9 @@ class Deadline(models.Model):
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+            # Calendar feed window, one range query per column
+            models.Index(fields=['original_due_date']),
+            models.Index(fields=['extended_due_date']),
+        ]
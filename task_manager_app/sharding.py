@@ -0,0 +1,387 @@
+"""User-based horizontal sharding.
+
+Every user's projects, tasks and deadlines live together on one of the databases
+listed in settings.TASK_SHARDS. The ShardAssignment directory on the default
+database records which one. ShardMiddleware selects the shard for the logged-in
+user and ShardRouter sends all ORM access for sharded models there, so the views
+keep using plain Project.objects / Task.objects querysets.
+
+Projects and tasks take their ids from one sequence shared by all shards, so they
+keep them when their user moves and URLs and calendar UIDs stay valid.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, Max, Q
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    ArchivedTask, Deadline, DeletedTask, IdSequence, Project, ProjectSnapshot, ShardAssignment, Task, TaskClosure,
+    TaskDependency,
+)
+
+SHARDED_MODELS = {
+    'project', 'task', 'deadline', 'taskclosure', 'taskdependency', 'archivedtask', 'projectsnapshot', 'snapshotrun',
+    'deletedtask',
+}
+# Models whose ids are allocated globally and kept across moves
+STABLE_ID_MODELS = (Project, Task)
+# Ids each process reserves at a time, so inserts rarely touch the shared sequence row
+ID_BLOCK_SIZE = 100
+# Query parameter and session key holding the shard the admin is looking at
+ADMIN_SHARD_PARAM = 'shard'
+ADMIN_SHARD_SESSION_KEY = 'admin_shard'
+
+_current_shard = ContextVar('current_shard', default=None)
+_id_blocks = {}
+_id_lock = threading.Lock()
+# A forked worker must not hand out the ids its parent reserved
+os.register_at_fork(after_in_child=_id_blocks.clear)
+
+
+def get_shards():
+    return list(getattr(settings, 'TASK_SHARDS', [DEFAULT_DB_ALIAS]))
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'task_manager_app' and model._meta.model_name in SHARDED_MODELS
+
+
+def get_current_shard():
+    return _current_shard.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_shard(alias):
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+def pick_shard():
+    """The configured shard holding the fewest users."""
+    counts = dict(ShardAssignment.objects.values_list('shard').annotate(users=Count('id')))
+    return min(get_shards(), key=lambda alias: counts.get(alias, 0))
+
+
+def get_assignment(user):
+    assignment = ShardAssignment.objects.filter(user_id=user.pk).first()
+    if assignment is None:
+        # Users created before sharding keep their data on the default database
+        assignment, _ = ShardAssignment.objects.get_or_create(user_id=user.pk, defaults={'shard': DEFAULT_DB_ALIAS})
+    return assignment
+
+
+def shard_for_user(user):
+    return get_assignment(user).shard
+
+
+def _reserve_ids(model, count):
+    name = model._meta.label_lower
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if not IdSequence.objects.filter(name=name).update(next_id=F('next_id') + count):
+            # First use: start above every id already on any shard
+            top = max(model.objects.using(alias).aggregate(top=Max('pk'))['top'] or 0 for alias in get_shards())
+            IdSequence.objects.get_or_create(name=name, defaults={'next_id': top + 1})
+            IdSequence.objects.filter(name=name).update(next_id=F('next_id') + count)
+        end = IdSequence.objects.filter(name=name).values_list('next_id', flat=True).get()
+    return iter(range(end - count, end))
+
+
+def allocate_id(model):
+    """A primary key for a new row of ``model`` that is unique across all shards."""
+    with _id_lock:
+        label = model._meta.label_lower
+        pk = next(_id_blocks.get(label, iter(())), None)
+        if pk is None:
+            _id_blocks[label] = _reserve_ids(model, ID_BLOCK_SIZE)
+            pk = next(_id_blocks[label])
+        return pk
+
+
+class ShardRouter:
+    def _db_for_model(self, model, **hints):
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None:
+            if is_sharded(instance.__class__) and instance._state.db:
+                return instance._state.db
+            if isinstance(instance, User):
+                return shard_for_user(instance)
+        return get_current_shard()
+
+    db_for_read = _db_for_model
+    db_for_write = _db_for_model
+
+    def allow_relation(self, obj1, obj2, **hints):
+        sharded1, sharded2 = is_sharded(obj1.__class__), is_sharded(obj2.__class__)
+        if sharded1 and sharded2:
+            return obj1._state.db == obj2._state.db
+        if sharded1 or sharded2:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS:
+            return None
+        if db in get_shards():
+            return app_label == 'task_manager_app' and (model_name is None or model_name in SHARDED_MODELS)
+        return None
+
+
+class ShardMiddleware:
+    """Route the request's ORM access to the logged-in user's shard.
+
+    Writes hold a row lock on the user's ShardAssignment for the whole request, so
+    move_user() cannot lock the user while a write is still in flight; it waits for
+    it to finish instead, and any write arriving later sees the lock and gets a 503.
+
+    The admin works on one whole shard at a time instead, picked with ?shard= (see
+    admin_shard()). Its writes lock only the users owning the rows they change, from
+    the ModelAdmin hooks; a UserLocked raised there is answered with the same 503.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.admin_prefix = None
+
+    def __call__(self, request):
+        if not request.user.is_authenticated:
+            return self.get_response(request)
+        if self.admin_prefix is None:
+            self.admin_prefix = reverse('admin:index')
+        is_admin = request.path.startswith(self.admin_prefix)
+        alias = admin_shard(request) if is_admin else get_assignment(request.user).shard
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return self.handle(request, alias)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            if not is_admin:
+                try:
+                    lock_users([request.user.pk])
+                except UserLocked:
+                    return _moving_response()
+            return self.handle(request, alias)
+
+    def handle(self, request, alias):
+        request.shard = alias
+        with use_shard(alias):
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, UserLocked):
+            # Drop the admin log entry written before the refused delete
+            transaction.set_rollback(True, using=DEFAULT_DB_ALIAS)
+            return _moving_response()
+        return None
+
+
+class UserLocked(Exception):
+    """A user whose data is being moved to another shard."""
+
+
+def lock_users(user_ids):
+    """Lock the assignments of ``user_ids`` until the transaction on the default database ends.
+
+    Raises UserLocked when one of the users is being moved.
+    """
+    assignments = ShardAssignment.objects.filter(user_id__in=list(user_ids)).select_for_update()
+    if any(assignments.values_list('locked', flat=True)):
+        raise UserLocked
+
+
+def _moving_response():
+    response = HttpResponse('Your data is being moved. Please try again in a minute.', status=503)
+    response['Retry-After'] = '60'
+    return response
+
+
+def admin_shard(request):
+    """The shard an admin user is browsing: ?shard= when given, else the last one picked."""
+    alias = request.GET.get(ADMIN_SHARD_PARAM)
+    if alias in get_shards():
+        request.session[ADMIN_SHARD_SESSION_KEY] = alias
+        return alias
+    alias = request.session.get(ADMIN_SHARD_SESSION_KEY)
+    return alias if alias in get_shards() else DEFAULT_DB_ALIAS
+
+
+def _timestamp_fields(model):
+    return [
+        field.name for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+
+
+def _clone(obj, remap, pk=None):
+    values = {field.attname: getattr(obj, field.attname) for field in obj._meta.concrete_fields}
+    values[obj._meta.pk.attname] = pk
+    for attname, ids in remap.items():
+        if values[attname] is not None:
+            values[attname] = ids[values[attname]] if ids is not None else None
+    return type(obj)(**values)
+
+
+def _write_batch(model, rows, target, remap, id_map, pending):
+    """Insert rows not yet on the target and overwrite the ones that are.
+
+    Rows pointing at a parent row that was created after its table was copied are
+    left in ``pending`` for the catch-up pass. Projects and tasks keep their ids;
+    other rows get new ones on the target.
+    """
+    resolvable = []
+    for row in rows:
+        if all(getattr(row, attname) in ids for attname, ids in remap.items()
+               if ids is not None and getattr(row, attname) is not None):
+            resolvable.append(row)
+            pending.discard(row.pk)
+        else:
+            pending.add(row.pk)
+    new = [row for row in resolvable if row.pk not in id_map]
+    existing = [row for row in resolvable if row.pk in id_map]
+    manager = model.objects.using(target)
+    if new:
+        keep_pk = model in STABLE_ID_MODELS
+        clones = [_clone(row, remap, pk=row.pk if keep_pk else None) for row in new]
+        for row, clone in zip(new, manager.bulk_create(clones)):
+            id_map[row.pk] = clone.pk
+        # bulk_create stamps auto_now fields with the current time; put the originals back
+        timestamps = _timestamp_fields(model)
+        if timestamps:
+            manager.bulk_update([_clone(row, remap, pk=id_map[row.pk]) for row in new], timestamps)
+    if existing:
+        cleared = {attname for attname, ids in remap.items() if ids is None}
+        fields = [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key and field.attname not in cleared
+        ]
+        manager.bulk_update([_clone(row, remap, pk=id_map[row.pk]) for row in existing], fields)
+
+
+def _copy(model, queryset, target, remap, id_map, batch_size, pending=None):
+    pending = set() if pending is None else pending
+    batch = []
+    for row in queryset.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _write_batch(model, batch, target, remap, id_map, pending)
+            batch = []
+    if batch:
+        _write_batch(model, batch, target, remap, id_map, pending)
+    return pending
+
+
+def _drop_missing(model, queryset, target, id_map):
+    """Remove target copies of rows deleted on the source since they were copied.
+
+    Returns the ids of source rows that have not been copied yet.
+    """
+    remaining = set(queryset.values_list('pk', flat=True))
+    gone = [old for old in id_map if old not in remaining]
+    model.objects.using(target).filter(pk__in=[id_map.pop(old) for old in gone]).delete()
+    return remaining.difference(id_map)
+
+
+def _copy_user_data(user, source, target, id_maps, pending, batch_size, changed_since=None):
+    project_map, task_map = id_maps[Project], id_maps[Task]
+    tables = (
+        (Project, Project.objects.using(source).filter(user=user), {}, 'updated_at'),
+        # Parents are linked up afterwards, once every task has its new id
+        (Task, Task.objects.using(source).filter(project__user=user), {'project_id': project_map, 'parent_id': None}, 'updated_at'),
+        (Deadline, Deadline.objects.using(source).filter(task__project__user=user), {'task_id': task_map}, 'updated_at'),
+        (ArchivedTask, ArchivedTask.objects.using(source).filter(project__user=user), {'project_id': project_map}, 'archived_at'),
+        (ProjectSnapshot, ProjectSnapshot.objects.using(source).filter(project__user=user), {'project_id': project_map}, 'updated_at'),
+        (DeletedTask, DeletedTask.objects.using(source).filter(user=user), {}, 'deleted_at'),
+    )
+    for model, queryset, remap, changed_field in tables:
+        if changed_since is not None:
+            uncopied = _drop_missing(model, queryset, target, id_maps[model])
+            # Rows edited since the first pass, rows created after it and rows whose
+            # parent row did not exist on the target yet
+            queryset = queryset.filter(
+                Q(**{f'{changed_field}__gte': changed_since})
+                | Q(pk__in=uncopied)
+                | Q(pk__in=pending[model])
+            )
+        _copy(model, queryset.order_by('pk'), target, remap, id_maps[model], batch_size, pending[model])
+
+    subtasks = Task.objects.using(source).filter(project__user=user, parent__isnull=False).values_list('pk', 'parent_id')
+    batch = []
+    for task_id, parent_id in subtasks.iterator(chunk_size=batch_size):
+        if task_id in task_map and parent_id in task_map:
+            batch.append(Task(pk=task_map[task_id], parent_id=task_map[parent_id]))
+        else:
+            pending[Task].add(task_id)
+        if len(batch) >= batch_size:
+            Task.objects.using(target).bulk_update(batch, ['parent'])
+            batch = []
+    Task.objects.using(target).bulk_update(batch, ['parent'])
+
+    # Closure and dependency rows are derived from the tasks, so they are rebuilt wholesale
+    TaskClosure.objects.using(target).filter(descendant__project__user=user).delete()
+    TaskDependency.objects.using(target).filter(task__project__user=user).delete()
+    pending[TaskClosure] = _copy(
+        TaskClosure, TaskClosure.objects.using(source).filter(descendant__project__user=user).order_by('pk'),
+        target, {'ancestor_id': task_map, 'descendant_id': task_map}, {}, batch_size,
+    )
+    pending[TaskDependency] = _copy(
+        TaskDependency, TaskDependency.objects.using(source).filter(task__project__user=user).order_by('pk'),
+        target, {'task_id': task_map, 'blocked_by_id': task_map}, {}, batch_size,
+    )
+
+
+def move_user(user, target, batch_size=500, log=None):
+    """Move a user's data to another shard while they keep using the site.
+
+    Rows are copied in batches while the user works on the old shard. The user is then
+    briefly locked to reads, the rows changed in the meantime are copied again, the
+    directory is switched and the old rows are deleted. Projects and tasks keep their
+    ids; deadlines, archive entries and snapshots get new ones. Taking the lock waits
+    for the user's in-flight writes (see ShardMiddleware), so nothing can reach the
+    source after the catch-up copy.
+    """
+    log = log or (lambda message: None)
+    if target not in get_shards():
+        raise ValueError(f"Unknown shard '{target}'.")
+    assignment = get_assignment(user)
+    source = assignment.shard
+    if source == target:
+        return
+
+    id_maps = {Project: {}, Task: {}, Deadline: {}, ArchivedTask: {}, ProjectSnapshot: {}, DeletedTask: {}}
+    pending = {model: set() for model in (*id_maps, TaskClosure, TaskDependency)}
+    started_at = timezone.now()
+    try:
+        log(f'Copying {user.username} from {source} to {target}...')
+        _copy_user_data(user, source, target, id_maps, pending, batch_size)
+
+        ShardAssignment.objects.filter(pk=assignment.pk).update(locked=True)
+        log('Copying changes made during the move...')
+        with transaction.atomic(using=target):
+            _copy_user_data(user, source, target, id_maps, pending, batch_size, changed_since=started_at)
+            if any(pending.values()):
+                raise RuntimeError('Rows kept changing during the move; try again.')
+        ShardAssignment.objects.filter(pk=assignment.pk).update(shard=target, locked=False)
+    except Exception:
+        ShardAssignment.objects.filter(pk=assignment.pk).update(locked=False)
+        # Leave the target as it was; the user's data is still complete on the source
+        Project.objects.using(target).filter(pk__in=list(id_maps[Project].values())).delete()
+        DeletedTask.objects.using(target).filter(user=user).delete()
+        raise
+
+    log(f'Removing old rows from {source}...')
+    project_ids = list(Project.objects.using(source).filter(user=user).values_list('pk', flat=True))
+    for start in range(0, len(project_ids), batch_size):
+        Project.objects.using(source).filter(pk__in=project_ids[start:start + batch_size]).delete()
+    # Including the ones those deletes just left behind
+    DeletedTask.objects.using(source).filter(user=user).delete()
+    log(f'Moved {len(id_maps[Project])} projects and {len(id_maps[Task])} tasks.')
@@ -1,3 +1,708 @@
-from django.test import TestCase
+import tempfile
+import unittest
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.models import DELETION, LogEntry
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connections
+from django.db.migrations.loader import MigrationLoader
+from django.template import engines
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .analytics import compute_report, get_report, load_task_arrays
+from .ical import escape_text, fold_line
+from .management.commands.analytics_report import orm_report
+from .management.commands.profile_startup import parse_importtime
+from .models import (
+    ArchivedTask, Deadline, DeletedTask, Project, ProjectSnapshot, ShardAssignment, SnapshotRun, Task, TaskClosure,
+    TaskDependency,
+)
+from .sharding import move_user, shard_for_user, use_shard
+from .warmup import compile_templates, open_connections, populate_urls, warmup
+
+# task_manager.test_settings configures two shards; other settings may not
+requires_shards = unittest.skipUnless(len(settings.TASK_SHARDS) > 1, 'Only one shard is configured')
+
+
+@requires_shards
+class ShardingTests(TestCase):
+    databases = '__all__'
+
+    def create_user(self, username):
+        return User.objects.create_user(username=username, password='secret-pass-123')
+
+    def test_new_users_are_spread_over_shards(self):
+        users = [self.create_user(f'user{i}') for i in range(len(settings.TASK_SHARDS))]
+        self.assertEqual({shard_for_user(user) for user in users}, set(settings.TASK_SHARDS))
+
+    def test_ids_are_unique_across_shards(self):
+        projects = []
+        for alias in settings.TASK_SHARDS:
+            user = self.create_user(f'user-{alias}')
+            with use_shard(alias):
+                projects.append(Project.objects.create(name='p', description='', user=user))
+        self.assertEqual(len({project.pk for project in projects}), len(projects))
+
+    def test_views_read_and_write_the_users_shard(self):
+        users = [self.create_user(f'user{i}') for i in range(2)]
+        for user in users:
+            self.client.force_login(user)
+            self.client.post(reverse('task_manager:project_create'), {
+                'name': f'{user.username} project', 'description': 'x', 'status': 'not_started',
+            })
+        first, second = (shard_for_user(user) for user in users)
+        self.assertNotEqual(first, second)
+        self.assertEqual(list(Project.objects.using(first).values_list('name', flat=True)), ['user0 project'])
+        self.assertEqual(list(Project.objects.using(second).values_list('name', flat=True)), ['user1 project'])
+
+        response = self.client.get(reverse('task_manager:project_list'))
+        self.assertEqual([project.name for project in response.context['projects']], ['user1 project'])
+
+    def test_move_user_copies_everything_and_removes_the_source(self):
+        user = self.create_user('mover')
+        source = shard_for_user(user)
+        target = next(alias for alias in settings.TASK_SHARDS if alias != source)
+        with use_shard(source):
+            project = Project.objects.create(name='p', description='', user=user)
+            parent = Task.objects.create(title='parent', project=project)
+            child = Task.objects.create(title='child', project=project, parent=parent)
+            child.add_blocker(parent)
+            Deadline.objects.create(task=child, original_due_date=timezone.now())
+            created_at = Project.objects.get(pk=project.pk).created_at
+
+        move_user(user, target, batch_size=1)
+
+        self.assertEqual(ShardAssignment.objects.get(user=user).shard, target)
+        self.assertFalse(Project.objects.using(source).filter(user=user).exists())
+        self.assertFalse(TaskClosure.objects.using(source).exists())
+        with use_shard(target):
+            moved = Project.objects.get(user=user)
+            self.assertEqual(moved.created_at, created_at)
+            # Ids survive the move, so saved URLs and calendar UIDs keep working
+            self.assertEqual(moved.pk, project.pk)
+            self.assertEqual(Task.objects.get(title='parent').pk, parent.pk)
+            parent = Task.objects.get(title='parent')
+            child = Task.objects.get(title='child')
+            self.assertEqual(child.parent, parent)
+            self.assertEqual(list(parent.get_descendants()), [child])
+            self.assertEqual(list(child.get_transitive_blockers()), [parent])
+            self.assertTrue(Deadline.objects.filter(task=child).exists())
+
+    def test_writes_are_refused_while_the_user_is_being_moved(self):
+        user = self.create_user('locked')
+        ShardAssignment.objects.filter(user=user).update(locked=True)
+        self.client.force_login(user)
+        response = self.client.post(reverse('task_manager:project_create'), {
+            'name': 'p', 'description': 'x', 'status': 'not_started',
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(Project.objects.using(shard_for_user(user)).exists())
+        self.assertEqual(self.client.get(reverse('task_manager:project_list')).status_code, 200)
+
+    def test_admin_browses_the_shard_picked_with_the_shard_parameter(self):
+        admin_user = User.objects.create_superuser('admin', password='secret-pass-123')
+        ShardAssignment.objects.filter(user=admin_user).update(shard=settings.TASK_SHARDS[0])
+        user = self.create_user('owner')
+        shard = settings.TASK_SHARDS[-1]
+        ShardAssignment.objects.filter(user=user).update(shard=shard)
+        with use_shard(shard):
+            project = Project.objects.create(name='elsewhere', description='', user=user)
+            task = Task.objects.create(title='remote task', project=project)
+        self.client.force_login(admin_user)
+
+        changelist = reverse('admin:task_manager_app_project_changelist')
+        self.assertEqual(self.client.get(changelist).context['cl'].result_count, 0)
+        response = self.client.get(changelist, {'shard': shard})
+        self.assertEqual([p.name for p in response.context['cl'].result_list], ['elsewhere'])
+
+        # The choice sticks for the change pages and autocompletes linked from there
+        response = self.client.get(reverse('admin:task_manager_app_task_change', args=[task.pk]))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'task_manager_app', 'model_name': 'task', 'field_name': 'project', 'term': 'else',
+        })
+        self.assertEqual([result['id'] for result in response.json()['results']], [str(project.pk)])
+        # Another user on the shard being moved does not hold up the owner's rows
+        bystander = self.create_user('bystander')
+        ShardAssignment.objects.filter(user=bystander).update(shard=shard, locked=True)
+        self.client.post(reverse('admin:task_manager_app_task_changelist'), {
+            'action': 'mark_completed', '_selected_action': [task.pk],
+        })
+        self.assertTrue(Task.objects.using(shard).get(pk=task.pk).is_completed)
+
+        ShardAssignment.objects.filter(user=user).update(locked=True)
+        response = self.client.post(reverse('admin:task_manager_app_task_changelist'), {
+            'action': 'mark_todo', '_selected_action': [task.pk],
+        })
+        self.assertEqual(response.status_code, 503)
+        response = self.client.post(reverse('admin:task_manager_app_task_delete', args=[task.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(Task.objects.using(shard).get(pk=task.pk).is_completed)
+        self.assertFalse(LogEntry.objects.filter(action_flag=DELETION).exists())
+
+    def test_deleting_a_user_removes_their_sharded_data(self):
+        user = self.create_user('leaver')
+        shard = shard_for_user(user)
+        with use_shard(shard):
+            Project.objects.create(name='p', description='', user=user)
+        user.delete()
+        self.assertFalse(Project.objects.using(shard).exists())
+
+
+
+@requires_shards
+class ShardMigrationTests(SimpleTestCase):
+    # The SQLite schema editor can't run inside a test's transaction
+    databases = '__all__'
+
+    def test_shard_migrations_leave_out_foreign_keys_to_auth_user(self):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+
+        def migration_sql(alias):
+            statements = []
+            for name in ('0001_initial', '0003_remove_project_is_completed_remove_project_owner_and_more',
+                         '0004_alter_project_user'):
+                key = ('task_manager_app', name)
+                with connections[alias].schema_editor(collect_sql=True, atomic=False) as editor:
+                    loader.get_migration(*key).apply(loader.project_state(key, at_end=False), editor, collect_sql=True)
+                statements += editor.collected_sql
+            return ' '.join(statements)
+
+        self.assertIn('"auth_user"', migration_sql('default'))
+        self.assertNotIn('"auth_user"', migration_sql(settings.TASK_SHARDS[-1]))
+
+class ShardedTestCase(TestCase):
+    """A logged-in user whose shard is selected for the whole test, as ShardMiddleware would."""
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='secret-pass-123')
+        self.shard = shard_for_user(self.user)
+        self.enterContext(use_shard(self.shard))
+        self.client.force_login(self.user)
+        self.project = Project.objects.create(name='Project', description='', user=self.user)
+
+    def create_task(self, title, **fields):
+        return Task.objects.create(title=title, project=self.project, **fields)
+
+
+class TaskHierarchyTests(ShardedTestCase):
+    def links(self):
+        return set(TaskClosure.objects.values_list('ancestor__title', 'descendant__title', 'depth'))
+
+    def test_inserting_subtasks_links_every_ancestor(self):
+        root = self.create_task('root')
+        child = self.create_task('child', parent=root)
+        self.create_task('leaf', parent=child)
+        self.assertEqual(self.links(), {
+            ('root', 'root', 0), ('child', 'child', 0), ('leaf', 'leaf', 0),
+            ('root', 'child', 1), ('child', 'leaf', 1), ('root', 'leaf', 2),
+        })
+        self.assertEqual({task.title for task in root.get_descendants()}, {'child', 'leaf'})
+
+    def test_moving_a_subtree_relinks_it_under_the_new_parent(self):
+        first, second = self.create_task('first'), self.create_task('second')
+        child = self.create_task('child', parent=first)
+        self.create_task('leaf', parent=child)
+        child.parent = second
+        child.save()
+        self.assertEqual(self.links(), {
+            ('first', 'first', 0), ('second', 'second', 0), ('child', 'child', 0), ('leaf', 'leaf', 0),
+            ('second', 'child', 1), ('child', 'leaf', 1), ('second', 'leaf', 2),
+        })
+        # Detaching makes it a root again, keeping its own subtree
+        child.parent = None
+        child.save()
+        self.assertEqual({task.title for task in Task.objects.get(title='leaf').get_ancestors()}, {'child'})
+
+    def test_a_task_cannot_move_under_its_own_subtask(self):
+        root = self.create_task('root')
+        child = self.create_task('child', parent=root)
+        root.parent = child
+        with self.assertRaises(ValidationError):
+            root.save()
+        self.assertEqual(self.links(), {('root', 'root', 0), ('child', 'child', 0), ('root', 'child', 1)})
+
+    def test_dependency_cycles_are_rejected(self):
+        first, second, third = (self.create_task(title) for title in ('first', 'second', 'third'))
+        first.add_blocker(second)
+        second.add_blocker(third)
+        with self.assertRaises(ValidationError):
+            third.add_blocker(first)
+        with self.assertRaises(ValidationError):
+            first.add_blocker(first)
+        self.assertEqual({task.title for task in first.get_transitive_blockers()}, {'second', 'third'})
+
+    def test_progress_rolls_up_all_descendants(self):
+        root = self.create_task('root')
+        child = self.create_task('child', parent=root, is_completed=True)
+        self.create_task('leaf', parent=child)
+        self.create_task('other', parent=root, is_completed=True)
+        self.assertAlmostEqual(root.get_progress(), 200 / 3)
+        self.assertEqual(Task.objects.get(title='leaf').get_progress(), 0)
+        self.assertEqual(Task.objects.get(title='other').get_progress(), 100)
+
+    def test_status_done_counts_as_done_for_blockers_and_progress(self):
+        root = self.create_task('root')
+        blocker = self.create_task('blocker', parent=root, status='D')
+        task = self.create_task('task', parent=root)
+        task.add_blocker(blocker)
+        self.assertTrue(task.is_unblocked())
+        self.assertFalse(Task.blocked_in_project(self.project.pk).exists())
+        self.assertEqual(root.get_progress(), 50)
+        response = self.client.get(reverse('task_manager:project_detail', args=[self.project.pk]))
+        rollup = {task.title: task.subtasks_completed for task in response.context['tasks']}
+        self.assertEqual(rollup['root'], 1)
+
+    @requires_shards
+    def test_links_go_to_the_database_the_task_is_saved_to(self):
+        other = next(alias for alias in settings.TASK_SHARDS if alias != self.shard)
+        project = Project.objects.using(other).create(name='Elsewhere', description='', user=self.user)
+        first = Task.objects.using(other).create(title='first', project=project)
+        second = Task.objects.using(other).create(title='second', project=project)
+        child = Task.objects.using(other).create(title='child', project=project, parent=first)
+        child.parent = second
+        child.save()
+        child.add_blocker(first)
+        self.assertFalse(TaskClosure.objects.exists())
+        links = TaskClosure.objects.using(other).values_list('ancestor__title', 'descendant__title', 'depth')
+        self.assertEqual(set(links), {
+            ('first', 'first', 0), ('second', 'second', 0), ('child', 'child', 0), ('second', 'child', 1),
+        })
+        self.assertEqual(list(second.get_descendants()), [child])
+        with self.assertRaises(ValidationError):
+            first.add_blocker(child)
+
+
+class TaskDependencyViewTests(ShardedTestCase):
+    def test_blockers_can_be_added_shown_and_removed(self):
+        task = self.create_task('deploy')
+        blocker = self.create_task('review')
+        response = self.client.post(reverse('task_manager:task_add_blocker', args=[task.pk]), {'blocked_by': blocker.pk})
+        self.assertRedirects(response, reverse('task_manager:task_detail', args=[task.pk]))
+        dependency = TaskDependency.objects.get(task=task)
+
+        response = self.client.get(reverse('task_manager:task_detail', args=[task.pk]))
+        self.assertFalse(response.context['is_unblocked'])
+        self.assertEqual([d.blocked_by for d in response.context['dependencies']], [blocker])
+        response = self.client.get(reverse('task_manager:project_detail', args=[self.project.pk]))
+        self.assertEqual(response.context['blocked_task_ids'], {task.pk})
+
+        self.client.post(reverse('task_manager:task_remove_blocker', args=[task.pk, dependency.pk]))
+        self.assertFalse(TaskDependency.objects.exists())
+
+    def test_adding_a_cycle_is_rejected_with_a_form_error(self):
+        first, second = self.create_task('first'), self.create_task('second')
+        first.add_blocker(second)
+        response = self.client.post(reverse('task_manager:task_add_blocker', args=[second.pk]), {'blocked_by': first.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('This dependency would create a cycle.', response.context['blocker_form'].non_field_errors())
+        self.assertEqual(TaskDependency.objects.count(), 1)
+
+    def test_project_page_shows_subtask_rollup(self):
+        parent = self.create_task('parent')
+        child = self.create_task('child', parent=parent, is_completed=True)
+        self.create_task('grandchild', parent=child)
+        response = self.client.get(reverse('task_manager:project_detail', args=[self.project.pk]))
+        rows = {task.title: task for task in response.context['tasks']}
+        self.assertEqual((rows['parent'].subtasks_completed, rows['parent'].subtask_count), (1, 2))
+        self.assertContains(response, '1/2 subtasks')
+
+
+class CalendarFeedTests(ShardedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('task_manager:calendar_feed', args=[self.user.userprofile.get_calendar_token()])
+
+    def test_text_is_escaped(self):
+        self.assertEqual(escape_text('a,b;c\\d\ne'), 'a\\,b\\;c\\\\d\\ne')
+
+    def test_long_lines_are_folded_without_splitting_characters(self):
+        line = 'SUMMARY:' + '\u00e9' * 100
+        folded = fold_line(line)
+        self.assertTrue(folded.endswith('\r\n'))
+        parts = folded[:-2].split('\r\n')
+        self.assertTrue(all(len(part.encode()) <= 75 for part in parts))
+        self.assertTrue(all(part.startswith(' ') for part in parts[1:]))
+        self.assertEqual(parts[0] + ''.join(part[1:] for part in parts[1:]), line)
+
+    def test_feed_lists_open_tasks_and_answers_304_when_unchanged(self):
+        task = self.create_task('Ship it', due_date=timezone.now() + timedelta(days=2))
+        self.create_task('Done already', due_date=timezone.now() + timedelta(days=2), is_completed=True)
+        response = self.client.get(self.url)
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn(f'UID:task-{task.pk}@testserver', body)
+        self.assertIn('SUMMARY:Ship it (Project)', body)
+        self.assertNotIn('Done already', body)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_since_returns_only_changes_with_completed_tasks_cancelled(self):
+        due = timezone.now() + timedelta(days=2)
+        unchanged = self.create_task('unchanged', due_date=due)
+        finished = self.create_task('finished', due_date=due)
+        Task.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        token = self.client.get(self.url)['X-Sync-Token']
+
+        finished.is_completed = True
+        finished.save()
+        response = self.client.get(self.url, {'since': token})
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn(f'UID:task-{finished.pk}@', body)
+        self.assertIn('STATUS:CANCELLED', body)
+        self.assertNotIn(f'UID:task-{unchanged.pk}@', body)
+        self.assertNotEqual(response['X-Sync-Token'], token)
+
+    def test_since_cancels_deleted_and_archived_tasks(self):
+        deleted = self.create_task('deleted', due_date=timezone.now())
+        archived = self.create_task('archived', is_completed=True)
+        restored = self.create_task('restored', is_completed=True)
+        Task.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        token = self.client.get(self.url)['X-Sync-Token']
+
+        deleted_pk = deleted.pk
+        deleted.delete()
+        Task.objects.filter(pk__in=[archived.pk, restored.pk]).update(completed_at=timezone.now() - timedelta(days=100))
+        call_command('archive_tasks', days=90, stdout=StringIO())
+        ArchivedTask.objects.get(original_id=restored.pk).restore()
+        response = self.client.get(self.url, {'since': token})
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.count('SUMMARY:Deleted task'), 2)
+        self.assertIn(f'UID:task-{deleted_pk}@', body)
+        self.assertIn(f'UID:task-{archived.pk}@', body)
+        self.assertEqual(body.count(f'UID:task-{restored.pk}@'), 1)
+        self.assertNotEqual(response['X-Sync-Token'], token)
+
+    def test_expired_tokens_require_a_full_sync(self):
+        task = self.create_task('old')
+        DeletedTask.objects.create(user=self.user, task_id=task.pk, deleted_at=timezone.now() - timedelta(days=100))
+        token = str(int((timezone.now() - DeletedTask.KEEP_FOR - timedelta(days=1)).timestamp() * 10 ** 6))
+        self.assertEqual(self.client.get(self.url, {'since': token}).status_code, 410)
+
+        output = StringIO()
+        call_command('archive_tasks', days=90, stdout=output)
+        self.assertIn('1 deletion records older than 90 days removed', output.getvalue())
+        self.assertFalse(DeletedTask.objects.exists())
+
+    def test_bad_tokens_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('task_manager:calendar_feed', args=['nope'])).status_code, 404)
+
+
+class ArchiveTests(ShardedTestCase):
+    def archive(self):
+        output = StringIO()
+        call_command('archive_tasks', days=90, stdout=output)
+        return output.getvalue()
+
+    def age(self, *tasks, days=100):
+        Task.objects.filter(pk__in=[task.pk for task in tasks]).update(completed_at=timezone.now() - timedelta(days=days))
+
+    def test_old_completed_leaves_are_archived_with_their_links(self):
+        blocker = self.create_task('blocker')
+        done = self.create_task('done', is_completed=True, status='D')
+        waiting = self.create_task('waiting')
+        done.add_blocker(blocker)
+        waiting.add_blocker(done)
+        Deadline.objects.create(task=done, original_due_date=timezone.now())
+        recent = self.create_task('recent', is_completed=True)
+        self.age(done)
+
+        output = self.archive()
+        self.assertIn(f'{self.shard}: archived 1 tasks.', output)
+        self.assertIn('KB before', output)
+        self.assertFalse(Task.objects.filter(pk=done.pk).exists())
+        self.assertTrue(Task.objects.filter(pk=recent.pk).exists())
+        archive = ArchivedTask.objects.get()
+        self.assertEqual(archive.original_id, done.pk)
+        self.assertEqual((archive.data['blocked_by'], archive.data['blocking']), ([blocker.pk], [waiting.pk]))
+
+        restored = archive.restore()
+        self.assertEqual(restored.pk, done.pk)
+        self.assertFalse(ArchivedTask.objects.exists())
+        self.assertTrue(Deadline.objects.filter(task=restored).exists())
+        self.assertEqual(
+            set(TaskDependency.objects.values_list('task_id', 'blocked_by_id')),
+            {(done.pk, blocker.pk), (waiting.pk, done.pk)},
+        )
+
+    def test_parents_wait_for_their_subtasks(self):
+        parent = self.create_task('parent', is_completed=True)
+        child = self.create_task('child', parent=parent)
+        self.age(parent, child)
+        self.archive()
+        self.assertFalse(ArchivedTask.objects.exists())
+
+        # Once the subtask is archived the parent is a leaf and goes in a later batch
+        child.is_completed = True
+        child.save()
+        self.age(child)
+        self.archive()
+        self.assertEqual(set(ArchivedTask.objects.values_list('original_id', flat=True)), {parent.pk, child.pk})
+
+    def test_project_page_counts_archived_tasks_like_live_ones(self):
+        done = self.create_task('done', is_completed=True)
+        status_only = self.create_task('status only', status='D')
+        self.create_task('open')
+        self.age(done, status_only)
+        self.archive()
+        response = self.client.get(reverse('task_manager:project_detail', args=[self.project.pk]))
+        self.assertEqual(response.context['archived_tasks_count'], 2)
+        self.assertEqual(response.context['total_tasks_count'], 3)
+        self.assertEqual(response.context['completed_tasks_count'], 2)
+
+    def test_reopened_tasks_are_not_archived(self):
+        task = self.create_task('reopened')
+        # Marked done in the admin, then reopened by the user long after
+        Task.objects.filter(pk=task.pk).update(status='D', is_completed=True, updated_at=timezone.now())
+        self.age(task)
+        self.client.get(reverse('task_manager:task_toggle_complete', args=[task.pk]))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.is_completed, task.completed_at), ('T', False, None))
+        self.archive()
+        self.assertTrue(Task.objects.filter(pk=task.pk).exists())
+        response = self.client.get(reverse('task_manager:project_detail', args=[self.project.pk]))
+        self.assertEqual(response.context['completed_tasks_count'], 0)
+
+
+class SnapshotProgressTests(ShardedTestCase):
+    def snapshot(self):
+        call_command('snapshot_progress', stdout=StringIO())
+        return SnapshotRun.objects.first().projects_updated
+
+    def test_only_changed_projects_are_snapshot_again(self):
+        other = Project.objects.create(name='Other', description='', user=self.user)
+        keep = self.create_task('keep')
+        gone = self.create_task('gone', is_completed=True)
+        Task.objects.create(title='elsewhere', project=other)
+        self.assertEqual(self.snapshot(), 2)
+        self.assertEqual(self.snapshot(), 0)
+
+        # A bulk delete, as the admin's delete_selected does, still marks the project changed
+        Task.objects.filter(pk=gone.pk).delete()
+        self.assertEqual(self.snapshot(), 1)
+        snapshot = ProjectSnapshot.objects.get(project=self.project)
+        self.assertEqual((snapshot.todo_count, snapshot.done_count), (1, 0))
+
+        # Becoming overdue changes the counts without any edit
+        Task.objects.filter(pk=keep.pk).update(due_date=timezone.now())
+        self.assertEqual(self.snapshot(), 1)
+        self.assertEqual(ProjectSnapshot.objects.get(project=self.project).overdue_count, 1)
+
+    def project_updates(self, delete):
+        with CaptureQueriesContext(connections[self.shard]) as queries:
+            delete()
+        table = Project._meta.db_table
+        return [query for query in queries if query['sql'].startswith(f'UPDATE "{table}"')]
+
+    def test_deletes_touch_each_project_once(self):
+        for i in range(3):
+            self.create_task(f'task {i}')
+        self.assertEqual(len(self.project_updates(Task.objects.all().delete)), 1)
+        self.create_task('last')
+        self.assertEqual(self.project_updates(self.project.delete), [])
+
+    def burndown(self, **params):
+        return self.client.get(reverse('task_manager:project_burndown', args=[self.project.pk]), params)
+
+    def test_burndown_carries_counts_over_missing_days(self):
+        for day, todo, done in ((1, 5, 0), (4, 3, 2), (6, 1, 4)):
+            ProjectSnapshot.objects.create(project=self.project, date=date(2026, 3, day), todo_count=todo, done_count=done)
+
+        series = self.burndown(start='2026-03-03', end='2026-03-07').json()
+        # The 1st is before the range but supplies the 3rd; the 5th repeats the 4th
+        self.assertEqual(series['dates'], ['2026-03-03', '2026-03-04', '2026-03-05', '2026-03-06', '2026-03-07'])
+        self.assertEqual(series['todo'], [5, 3, 3, 1, 1])
+        self.assertEqual(series['done'], [0, 2, 2, 4, 4])
+        self.assertEqual(series['in_progress'], [0] * 5)
+
+        # Nothing is known about the days before the first snapshot
+        series = self.burndown(start='2026-02-27', end='2026-03-02').json()
+        self.assertEqual((series['dates'], series['todo']), (['2026-03-01', '2026-03-02'], [5, 5]))
+
+    def test_burndown_rejects_bad_ranges(self):
+        self.assertEqual(self.burndown(start='March').status_code, 400)
+        self.assertEqual(self.burndown(start='2026-03-07', end='2026-03-03').status_code, 400)
+        self.assertEqual(self.burndown(start='2025-01-01', end='2026-03-03').status_code, 400)
+        self.assertEqual(self.burndown(end='2026-03-03').status_code, 200)
+
+
+class AnalyticsTests(ShardedTestCase):
+    def test_cycle_time_runs_to_completion_not_to_the_last_edit(self):
+        task = self.create_task('task')
+        task.is_completed = True
+        task.save()
+        self.assertIsNotNone(task.completed_at)
+        now = timezone.now()
+        Task.objects.filter(pk=task.pk).update(created_at=now - timedelta(days=4), completed_at=now - timedelta(days=2))
+        # A later typo fix must not move the completion
+        task.refresh_from_db()
+        task.title = 'Task'
+        task.save()
+
+        report = compute_report(load_task_arrays(self.user))
+        self.assertEqual(report['cycle_time']['mean_days'], 2)
+        self.assertEqual(report['weekly_throughput'][0], 1)
+        self.assertEqual(orm_report(self.user)['percentiles'][0], report['cycle_time']['percentiles'][0]['days'])
+
+    def test_reopening_clears_the_completion_time(self):
+        task = self.create_task('task', status='D')
+        self.assertIsNotNone(task.completed_at)
+        task.status = 'P'
+        task.save()
+        self.assertIsNone(Task.objects.get(pk=task.pk).completed_at)
+
+    def test_reports_are_cached_until_a_task_changes(self):
+        cache.clear()
+        task = self.create_task('task', priority='H')
+        gone = self.create_task('gone')
+        with mock.patch('task_manager_app.analytics.load_task_arrays', wraps=load_task_arrays) as load:
+            self.assertEqual(get_report(self.user)['total_tasks'], 2)
+            self.assertEqual(get_report(self.user)['total_tasks'], 2)
+            self.assertEqual(load.call_count, 1)
+
+            task.is_completed = True
+            task.save()
+            self.assertEqual(get_report(self.user)['by_priority']['High']['completed'], 1)
+            gone.delete()
+            self.assertEqual(get_report(self.user)['total_tasks'], 1)
+            self.assertEqual(load.call_count, 3)
+
+    def test_json_format(self):
+        cache.clear()
+        self.create_task('late', due_date=timezone.now() - timedelta(days=1))
+        response = self.client.get(reverse('task_manager:analytics'), {'format': 'json'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        report = response.json()
+        self.assertEqual(report['total_tasks'], 1)
+        self.assertEqual(report['overdue_by_project'], [
+            {'project_id': self.project.pk, 'name': 'Project', 'overdue_rate': 100.0},
+        ])
+
+
+class TaskListTests(ShardedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Project.objects.create(name='Other', description='', user=self.user)
+        self.create_task('a', status='D', priority='H')
+        self.create_task('b', status='D', priority='L')
+        self.create_task('c', status='T', priority='H')
+        Task.objects.create(title='d', project=self.other, status='T', priority='H')
+
+    def counts(self, response, facet):
+        return {option['label']: option['count'] for option in response.context['facets'][facet]}
+
+    def test_each_facet_ignores_its_own_filter_but_applies_the_others(self):
+        response = self.client.get(reverse('task_manager:task_list'), {'status': 'D', 'project': self.project.pk})
+        self.assertEqual({task.title for task in response.context['tasks']}, {'a', 'b'})
+        # Status counts keep the project filter but not the status one
+        self.assertEqual(self.counts(response, 'status'), {'To Do': 1, 'In Progress': 0, 'Done': 2})
+        self.assertEqual(self.counts(response, 'priority'), {'Low': 1, 'Medium': 0, 'High': 1})
+        self.assertEqual(self.counts(response, 'project'), {'Other': 0, 'Project': 2})
+
+    def test_priority_sort_and_invalid_filters(self):
+        response = self.client.get(reverse('task_manager:task_list'), {'sort': '-priority', 'status': 'X'})
+        titles = [task.title for task in response.context['tasks']]
+        self.assertEqual(titles[-1], 'b')
+        self.assertEqual(len(titles), 4)
+
+
+class ConditionalPageTests(ShardedTestCase):
+    def setUp(self):
+        super().setUp()
+        # The CSRF cookie is part of the ETag; a browser has it from its first page
+        self.client.get(reverse('task_manager:project_list'))
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_answer_304_and_are_never_shared(self):
+        url = reverse('task_manager:project_detail', args=[self.project.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(set(response['Cache-Control'].split(', ')), {'private', 'no-cache', 'max-age=0'})
+        self.assertIn('Cookie', response['Vary'])
+
+        repeat = self.revalidate(url, response)
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b'')
+        self.assertIn('private', repeat['Cache-Control'])
+        # The query string is part of the page, so it is part of the ETag too
+        self.assertEqual(self.client.get(url + '?x=1', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_changes_to_tasks_give_a_fresh_page(self):
+        task = self.create_task('a')
+        url = reverse('task_manager:task_list')
+        response = self.client.get(url)
+
+        self.client.get(reverse('task_manager:task_toggle_complete', args=[task.pk]))
+        changed = self.revalidate(url, response)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+        self.client.post(reverse('task_manager:task_delete', args=[task.pk]))
+        self.assertEqual(self.revalidate(url, changed).status_code, 200)
+
+    def test_pending_messages_are_rendered_not_revalidated(self):
+        url = reverse('task_manager:project_list')
+        response = self.client.get(url)
+        self.client.post(reverse('task_manager:project_create'), {
+            'name': 'New', 'description': 'x', 'status': 'not_started',
+        })
+        fresh = self.revalidate(url, response)
+        self.assertContains(fresh, 'Project created successfully!')
+        self.assertNotIn('ETag', fresh)
+        # Once the message has been shown, the page can be revalidated again
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+
+class WarmupTests(TestCase):
+    databases = '__all__'
+
+    def test_templates_are_compiled_into_the_cached_loader(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(f'{directory}/good.html', 'w') as template:
+                template.write('{{ value }}')
+            with open(f'{directory}/bad.html', 'w') as template:
+                template.write('{% if %}')
+            settings_override = override_settings(TEMPLATES=[{
+                'BACKEND': 'django.template.backends.django.DjangoTemplates', 'DIRS': [directory],
+            }])
+            with settings_override, self.assertLogs('task_manager_app.warmup', 'ERROR') as logs:
+                self.assertEqual(compile_templates(), 1)
+                loader = engines['django'].engine.template_loaders[0]
+                self.assertEqual(list(loader.get_template_cache), ['good.html'])
+        self.assertIn('bad.html', logs.output[0])
+
+    def test_urls_and_connections_are_ready(self):
+        self.assertGreater(populate_urls(), 0)
+        self.assertEqual(open_connections(), len(settings.DATABASES))
+        for connection in connections.all():
+            self.assertIsNotNone(connection.connection)
+
+    def test_warmup_times_each_step(self):
+        self.assertEqual(set(warmup(databases=False)), {'templates', 'urls'})
+        timings = warmup()
+        self.assertEqual(set(timings), {'templates', 'urls', 'databases'})
+        self.assertTrue(all(seconds >= 0 for seconds in timings.values()))
+
+    def test_importtime_output_is_parsed(self):
+        stderr = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   _io\n'
+            'import time:      1500 |       4200 | task_manager.wsgi\n'
+            'Traceback noise\n'
+        )
+        self.assertEqual(parse_importtime(stderr), [('_io', 120, 120), ('task_manager.wsgi', 1500, 4200)])
@@ -16,10 +16,17 @@ urlpatterns = [
     path('projects/<int:project_id>/edit/', views.project_edit, name='project_edit'),
     path('projects/<int:project_id>/delete/', views.project_delete, name='project_delete'),
     path('projects/<int:project_id>/tasks/create/', views.task_create, name='task_create'),
+    path('projects/<int:project_id>/archive/', views.project_archive, name='project_archive'),
+    path('projects/<int:project_id>/burndown/', views.project_burndown, name='project_burndown'),
+    path('archive/<int:archive_id>/restore/', views.archived_task_restore, name='archived_task_restore'),
     path('tasks/<int:task_id>/edit/', views.task_edit, name='task_edit'),
     path('tasks/<int:task_id>/delete/', views.task_delete, name='task_delete'),
     path('tasks/<int:task_id>/toggle/', views.task_toggle_complete, name='task_toggle_complete'),
     path('tasks/', views.task_list, name='task_list'),
     path('tasks/<int:task_id>/', views.task_detail, name='task_detail'),
+    path('tasks/<int:task_id>/blockers/', views.task_add_blocker, name='task_add_blocker'),
+    path('tasks/<int:task_id>/blockers/<int:dependency_id>/delete/', views.task_remove_blocker, name='task_remove_blocker'),
+    path('analytics/', views.analytics, name='analytics'),
     path('logout/', views.logout_view, name='logout'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
 ] 
\ No newline at end of file
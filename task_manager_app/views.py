@@ -3,11 +3,91 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth import login, logout
-from .models import Project, Task, Deadline, UserProfile
-from .forms import ProjectForm, TaskForm, UserRegistrationForm, UserProfileForm
-from django.db.models import Count, Q
+from .models import Project, Task, Deadline, DeletedTask, UserProfile, ArchivedTask, TaskDependency
+from .forms import BlockerForm, ProjectForm, TaskForm, TaskFilterForm, UserRegistrationForm, UserProfileForm
+from .analytics import get_report
+from .ical import iter_calendar
+from .sharding import shard_for_user
+from django.db.models import Case, Count, Exists, F, Max, OuterRef, Q, When
+from django.db.models.functions import Coalesce, Greatest
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseBadRequest, HttpResponseGone, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET, require_POST
+from django.conf import settings
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from functools import wraps
+import hashlib
+
+CALENDAR_PAST_DAYS = 30
+CALENDAR_FUTURE_DAYS = 365
+
+def conditional_page(validator):
+    """Answer GETs with 304 when the validator's view of the page data is unchanged.
+
+    ``validator(request, *args, **kwargs)`` returns ``(last_modified, fingerprint)``, ideally
+    from a single aggregate query. The ETag covers both, plus the user, their sidebar details,
+    the CSRF cookie and the query string, since all of them end up in the page. Responses
+    are marked private and must be revalidated, so per-user pages are never shared.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # Pending flash messages are only shown by a fresh render
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                response = view(request, *args, **kwargs)
+            else:
+                last_modified, fingerprint = validator(request, *args, **kwargs)
+                user = request.user
+                picture = user.userprofile.profile_picture.name
+                key = (
+                    f'{user.pk}:{user.username}:{user.email}:{picture}:'
+                    f'{request.COOKIES.get(settings.CSRF_COOKIE_NAME)}:{request.get_full_path()}:'
+                    f'{last_modified and last_modified.isoformat()}:{fingerprint}'
+                )
+                etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+                timestamp = last_modified.timestamp() if last_modified else None
+                response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code == 200:
+                        response['ETag'] = etag
+                        if timestamp is not None:
+                            response['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, private=True, no_cache=True, max_age=0)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
+
+
+def _user_pages_validator(request, *args, **kwargs):
+    """Latest change and row counts across the user's projects and tasks, in one query."""
+    stats = Project.objects.filter(user=request.user).aggregate(
+        latest_project=Max('updated_at'),
+        latest_task=Max('tasks__updated_at'),
+        projects=Count('id', distinct=True),
+        tasks=Count('tasks'),
+    )
+    return _latest(stats['latest_project'], stats['latest_task']), (stats['projects'], stats['tasks'])
+
+
+def _project_detail_validator(request, project_id):
+    stats = Project.objects.filter(id=project_id, user=request.user).aggregate(
+        latest_project=Max('updated_at'),
+        latest_task=Max('tasks__updated_at'),
+        tasks=Count('tasks'),
+    )
+    return _latest(stats['latest_project'], stats['latest_task']), stats['tasks']
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
 
 def homepage(request):
     """View for the main homepage that shows different content based on authentication status."""
@@ -68,9 +148,11 @@ def home(request):
     return render(request, 'task_manager_app/home.html', context)
 
 @login_required
+@conditional_page(_user_pages_validator)
 def project_list(request):
     projects = Project.objects.filter(user=request.user).annotate(
-        completed_tasks_count=Count('tasks', filter=Q(tasks__is_completed=True))
+        completed_tasks_count=Count('tasks', filter=Task.done_filter('tasks__'), distinct=True),
+        archived_tasks_count=Count('archived_tasks', distinct=True),
     ).order_by('-created_at')
     return render(request, 'task_manager_app/project_list.html', {'projects': projects})
 
@@ -89,34 +171,103 @@ def project_create(request):
     return render(request, 'task_manager_app/project_form.html', {'form': form})
 
 @login_required
+@conditional_page(_project_detail_validator)
 def project_detail(request, project_id):
     project = get_object_or_404(Project, id=project_id, user=request.user)
-    tasks = project.tasks.all()
+    # Subtask progress is rolled up through the closure table, one count pair per task
+    subtasks = Q(descendant_links__depth__gt=0)
+    tasks = project.tasks.annotate(
+        subtask_count=Count('descendant_links', filter=subtasks),
+        subtasks_completed=Count('descendant_links', filter=subtasks & Task.done_filter('descendant_links__descendant__')),
+    ).prefetch_related('dependencies__blocked_by')
     
-    # Calculate completion percentage
-    total_tasks = tasks.count()
-    completed_tasks = tasks.filter(is_completed=True).count()
+    # Calculate completion percentage. Archived tasks count as completed on the same
+    # terms as live ones (Task.is_done).
+    archived = project.archived_tasks.aggregate(
+        total=Count('id'), completed=Count('id', filter=Task.done_filter('data__')),
+    )
+    archived_tasks = archived['total']
+    total_tasks = project.tasks.count() + archived_tasks
+    completed_tasks = project.tasks.filter(Task.done_filter()).count() + archived['completed']
     completion_percentage = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
     
     return render(request, 'task_manager_app/project_detail.html', {
         'project': project,
         'tasks': tasks,
         'completion_percentage': completion_percentage,
+        'total_tasks_count': total_tasks,
         'completed_tasks_count': completed_tasks,
+        'archived_tasks_count': archived_tasks,
+        'blocked_task_ids': set(Task.blocked_in_project(project.id).values_list('id', flat=True)),
     })
 
+@login_required
+def project_burndown(request, project_id):
+    """Daily task counts for a project between ?start and ?end (YYYY-MM-DD), read from snapshots."""
+    project = get_object_or_404(Project, id=project_id, user=request.user)
+    try:
+        end = date.fromisoformat(request.GET['end']) if 'end' in request.GET else timezone.localdate()
+        start = date.fromisoformat(request.GET['start']) if 'start' in request.GET else end - timedelta(days=29)
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be YYYY-MM-DD.')
+    if start > end or (end - start).days > 366:
+        return HttpResponseBadRequest('Invalid date range.')
+
+    fields = ('date', 'todo_count', 'in_progress_count', 'done_count', 'overdue_count')
+    snapshots = project.snapshots.filter(date__range=(start, end)).values_list(*fields)
+    # The last snapshot before the range supplies the values until the first change inside it
+    previous = project.snapshots.filter(date__lt=start).order_by('-date').values_list(*fields).first()
+    by_date = {row[0]: row[1:] for row in snapshots}
+    current = previous[1:] if previous else None
+
+    series = {'dates': [], 'todo': [], 'in_progress': [], 'done': [], 'overdue': []}
+    day = start
+    while day <= end:
+        current = by_date.get(day, current)
+        if current is not None:
+            series['dates'].append(day.isoformat())
+            for key, value in zip(('todo', 'in_progress', 'done', 'overdue'), current):
+                series[key].append(value)
+        day += timedelta(days=1)
+    return JsonResponse(series)
+
+@login_required
+def analytics(request):
+    report = get_report(request.user)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(report)
+    return render(request, 'task_manager_app/analytics.html', {'report': report})
+
+@login_required
+def project_archive(request, project_id):
+    project = get_object_or_404(Project, id=project_id, user=request.user)
+    paginator = Paginator(project.archived_tasks.all(), 50)
+    page = paginator.get_page(request.GET.get('page'))
+    return render(request, 'task_manager_app/archived_task_list.html', {
+        'project': project,
+        'page_obj': page,
+    })
+
+@login_required
+@require_POST
+def archived_task_restore(request, archive_id):
+    archive = get_object_or_404(ArchivedTask, id=archive_id, project__user=request.user)
+    task = archive.restore()
+    messages.success(request, f'Task "{task.title}" restored.')
+    return redirect('task_manager:project_detail', project_id=task.project_id)
+
 @login_required
 def task_create(request, project_id):
     project = get_object_or_404(Project, id=project_id, user=request.user)
     if request.method == 'POST':
-        form = TaskForm(request.POST)
+        form = TaskForm(request.POST, project=project)
         if form.is_valid():
             task = form.save(commit=False)
             task.project = project
             task.save()
             return redirect('task_manager:project_detail', project_id=project.id)
     else:
-        form = TaskForm()
+        form = TaskForm(project=project)
     return render(request, 'task_manager_app/task_form.html', {'form': form, 'project': project})
 
 @login_required
@@ -135,7 +286,7 @@ def task_update(request, pk):
 @login_required
 def task_toggle_complete(request, task_id):
     task = get_object_or_404(Task, id=task_id, project__user=request.user)
-    task.is_completed = not task.is_completed
+    task.set_done(not task.is_done)
     task.save()
     return redirect('task_manager:project_detail', project_id=task.project.id)
 
@@ -153,8 +304,8 @@ def profile(request):
     # Get user's tasks
     tasks = Task.objects.filter(project__user=user)
     total_tasks = tasks.count()
-    completed_tasks = tasks.filter(is_completed=True).count()
-    pending_tasks = tasks.filter(is_completed=False).count()
+    completed_tasks = tasks.filter(Task.done_filter()).count()
+    pending_tasks = tasks.exclude(Task.done_filter()).count()
     
     # Get recent activity
     recent_projects = projects.order_by('-updated_at')[:5]
@@ -162,6 +313,9 @@ def profile(request):
     
     context = {
         'user_profile': user_profile,
+        'calendar_url': request.build_absolute_uri(
+            reverse('task_manager:calendar_feed', args=[user_profile.get_calendar_token()])
+        ),
         'total_projects': total_projects,
         'completed_projects': completed_projects,
         'active_projects': active_projects,
@@ -200,19 +354,145 @@ def project_delete(request, project_id):
         return redirect('task_manager:project_list')
     return render(request, 'task_manager_app/project_confirm_delete.html', {'project': project})
 
+TASK_SORT_ORDERS = {
+    '-created': ['-created_at'],
+    'created': ['created_at'],
+    'due': [F('due_date').asc(nulls_last=True), '-created_at'],
+    '-due': [F('due_date').desc(nulls_last=True), '-created_at'],
+    '-priority': ['-priority_rank', '-created_at'],
+    'priority': ['priority_rank', '-created_at'],
+    'title': ['title'],
+}
+PRIORITY_RANK = Case(When(priority='L', then=0), When(priority='M', then=1), When(priority='H', then=2))
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def _task_filters(data):
+    """One Q per active filter dimension, so facets can leave out their own dimension."""
+    filters = {}
+    if data.get('status'):
+        filters['status'] = Q(status=data['status'])
+    if data.get('priority'):
+        filters['priority'] = Q(priority=data['priority'])
+    if data.get('project'):
+        filters['project'] = Q(project=data['project'])
+    if data.get('completed'):
+        filters['completed'] = Task.done_filter() if data['completed'] == 'yes' else ~Task.done_filter()
+    # Whole-day bounds as datetimes, so the due_date indexes stay usable
+    if data.get('due_after'):
+        filters['due_after'] = Q(due_date__gte=_start_of_day(data['due_after']))
+    if data.get('due_before'):
+        filters['due_before'] = Q(due_date__lt=_start_of_day(data['due_before'] + timedelta(days=1)))
+    return filters
+
+
+def _combine(filters, exclude=None):
+    combined = Q()
+    for name, condition in filters.items():
+        if name != exclude:
+            combined &= condition
+    return combined
+
+
 @login_required
+@conditional_page(_user_pages_validator)
 def task_list(request):
-    tasks = Task.objects.filter(project__user=request.user).order_by('-created_at')
-    return render(request, 'task_manager_app/task_list.html', {'tasks': tasks})
+    projects = Project.objects.filter(user=request.user).order_by('name')
+    form = TaskFilterForm(request.GET or None, projects=projects)
+    data = {}
+    if form.is_bound:
+        form.is_valid()
+        # Invalid values are left out of cleaned_data; the valid filters still apply
+        data = form.cleaned_data
+    filters = _task_filters(data)
+    tasks = Task.objects.filter(project__user=request.user)
+
+    # Facet counts for every dimension in one conditional-aggregation query. Each facet
+    # applies all the other active filters but not its own, so its options stay visible.
+    projects = list(projects)
+    dimensions = {
+        'status': [(value, label, Q(status=value)) for value, label in Task.STATUS_CHOICES],
+        'priority': [(value, label, Q(priority=value)) for value, label in Task.PRIORITY_CHOICES],
+        'project': [(str(project.pk), project.name, Q(project=project.pk)) for project in projects],
+        'completed': [('yes', 'Completed', Task.done_filter()), ('no', 'Not completed', ~Task.done_filter())],
+    }
+    aggregates = {
+        f'{name}_{value}': Count('id', filter=_combine(filters, exclude=name) & condition)
+        for name, options in dimensions.items()
+        for value, label, condition in options
+    }
+    counts = tasks.aggregate(**aggregates) if aggregates else {}
+
+    facets = {}
+    for name, options in dimensions.items():
+        active = request.GET.get(name, '')
+        facets[name] = []
+        for value, label, condition in options:
+            params = request.GET.copy()
+            params.pop('page', None)
+            if active == value:
+                params.pop(name, None)
+            else:
+                params[name] = value
+            facets[name].append({
+                'label': label,
+                'count': counts[f'{name}_{value}'],
+                'active': active == value,
+                'url': f'?{params.urlencode()}',
+            })
+
+    tasks = tasks.filter(_combine(filters)).select_related('project')
+    sort = data.get('sort') or '-created'
+    if sort in ('priority', '-priority'):
+        tasks = tasks.annotate(priority_rank=PRIORITY_RANK)
+    page = Paginator(tasks.order_by(*TASK_SORT_ORDERS[sort]), 50).get_page(request.GET.get('page'))
+    params = request.GET.copy()
+    params.pop('page', None)
+
+    return render(request, 'task_manager_app/task_list.html', {
+        'tasks': page,
+        'page_obj': page,
+        'form': form,
+        'facets': facets,
+        'query_string': params.urlencode(),
+    })
 
 @login_required
-def task_detail(request, task_id):
+def task_detail(request, task_id, blocker_form=None):
     task = get_object_or_404(Task, id=task_id, project__user=request.user)
     return render(request, 'task_manager_app/task_detail.html', {
         'task': task,
-        'project': task.project
+        'project': task.project,
+        'subtasks': task.subtasks.all(),
+        'progress': task.get_progress(),
+        'is_unblocked': task.is_unblocked(),
+        'dependencies': task.dependencies.select_related('blocked_by'),
+        'blocking': task.blocking.select_related('task'),
+        'blocker_form': blocker_form or BlockerForm(task=task),
     })
 
+@login_required
+@require_POST
+def task_add_blocker(request, task_id):
+    task = get_object_or_404(Task, id=task_id, project__user=request.user)
+    form = BlockerForm(request.POST, task=task)
+    if form.is_valid() and form.save():
+        messages.success(request, f'"{task.title}" is now blocked by "{form.cleaned_data["blocked_by"].title}".')
+        return redirect('task_manager:task_detail', task_id=task.id)
+    return task_detail(request, task_id, blocker_form=form)
+
+@login_required
+@require_POST
+def task_remove_blocker(request, task_id, dependency_id):
+    dependency = get_object_or_404(
+        TaskDependency, id=dependency_id, task_id=task_id, task__project__user=request.user,
+    )
+    dependency.delete()
+    return redirect('task_manager:task_detail', task_id=task_id)
+
 @login_required
 def task_edit(request, task_id):
     task = get_object_or_404(Task, id=task_id, project__user=request.user)
@@ -271,3 +551,130 @@ def profile_edit(request):
         form = UserProfileForm(instance=request.user.userprofile)
     
     return render(request, 'task_manager_app/profile_edit.html', {'form': form})
+
+
+def _sync_token(value):
+    delta = value - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    return str(delta // timedelta(microseconds=1))
+
+
+def _parse_sync_token(token):
+    return datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=int(token))
+
+
+def _task_ids_in_ranges(alias, user, task_lookup, *deadline_lookups):
+    """Ids of the user's tasks matching any of the lookups, as one UNION subquery.
+
+    Each lookup is a range on a single indexed column, so every branch can use its
+    index; an OR of them across the deadline join would scan all of the user's tasks.
+    """
+    queries = [Task.objects.using(alias).filter(project__user=user, **task_lookup).order_by().values('id')]
+    queries += [
+        Deadline.objects.using(alias).filter(task__project__user=user, **lookup).order_by().values('task_id')
+        for lookup in deadline_lookups
+    ]
+    return queries[0].union(*queries[1:])
+
+
+@require_GET
+def calendar_feed(request, token):
+    """Token-authenticated iCalendar feed of task due dates.
+
+    Without parameters the feed covers a window around today. With ?since=<sync token>
+    it only contains tasks changed after that token, with completed, deleted and archived
+    ones marked as cancelled. Deletions are kept for DeletedTask.KEEP_FOR, so older
+    tokens get a 410 and the client has to fetch the full feed again.
+    """
+    profile = UserProfile.objects.filter(calendar_token=token).select_related('user').first()
+    if profile is None:
+        raise Http404
+    user = profile.user
+
+    # Bound to the shard explicitly: the response is streamed after the view returns
+    alias = shard_for_user(user)
+    tasks = Task.objects.using(alias).filter(project__user=user).annotate(
+        effective_due=Coalesce('deadline__extended_due_date', 'deadline__original_due_date', 'due_date'),
+        last_modified=Greatest('updated_at', Coalesce('deadline__updated_at', 'updated_at')),
+    )
+    deleted = DeletedTask.objects.none()
+    since = request.GET.get('since')
+    if since:
+        try:
+            since = _parse_sync_token(since)
+        except (ValueError, OverflowError):
+            return HttpResponseBadRequest('Invalid sync token.')
+        if since < timezone.now() - DeletedTask.KEEP_FOR:
+            return HttpResponseGone('Sync token expired; fetch the full feed again.')
+        tasks = tasks.filter(id__in=_task_ids_in_ranges(
+            alias, user, {'updated_at__gt': since}, {'updated_at__gt': since},
+        ))
+        # A task archived and then restored is listed as a live task instead
+        deleted = DeletedTask.objects.using(alias).filter(user=user, deleted_at__gt=since).exclude(
+            Exists(Task.objects.using(alias).filter(pk=OuterRef('task_id'))),
+        )
+        window = since.isoformat()
+    else:
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today - timedelta(days=CALENDAR_PAST_DAYS)
+        end = today + timedelta(days=CALENDAR_FUTURE_DAYS)
+        # The ranges find the candidates; the annotation filter keeps it exact
+        tasks = tasks.filter(
+            id__in=_task_ids_in_ranges(
+                alias, user, {'due_date__range': (start, end)},
+                {'original_due_date__range': (start, end)}, {'extended_due_date__range': (start, end)},
+            ),
+            effective_due__range=(start, end),
+        ).exclude(Task.done_filter())
+        window = f'{start.date()}:{end.date()}'
+
+    stats = tasks.aggregate(latest=Max('last_modified'), count=Count('id'))
+    gone = deleted.aggregate(latest=Max('deleted_at'), count=Count('id'))
+    latest = _latest(stats['latest'], gone['latest'])
+    count = stats['count'] + gone['count']
+    etag = quote_etag(hashlib.md5(f"{user.pk}:{window}:{count}:{latest}".encode()).hexdigest())
+    last_modified = latest.timestamp() if latest else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    sync_token = _sync_token(latest) if latest else request.GET.get('since', '')
+    host = request.get_host()
+    rows = tasks.order_by().values_list(
+        'id', 'title', 'description', 'project__name', 'status', 'is_completed', 'effective_due', 'last_modified',
+    )
+
+    # One event per task, however often it was archived and restored
+    deleted_rows = deleted.order_by().values('task_id').annotate(last_deleted=Max('deleted_at')).values_list(
+        'task_id', 'last_deleted',
+    )
+
+    def events():
+        for task_id, deleted_at in deleted_rows.iterator(chunk_size=500):
+            yield {
+                'uid': f'task-{task_id}@{host}',
+                'summary': 'Deleted task',
+                'description': '',
+                'start': deleted_at,
+                'last_modified': deleted_at,
+                'cancelled': True,
+            }
+        for task_id, title, description, project_name, status, is_completed, due, modified in rows.iterator(chunk_size=500):
+            yield {
+                'uid': f'task-{task_id}@{host}',
+                'summary': f'{title} ({project_name})',
+                'description': description,
+                'start': due or modified,
+                'last_modified': modified,
+                'cancelled': status == 'D' or is_completed or due is None,
+            }
+
+    response = StreamingHttpResponse(
+        iter_calendar(events(), f"{user.username}'s tasks", sync_token),
+        content_type='text/calendar; charset=utf-8',
+    )
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['X-Sync-Token'] = sync_token
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,71 @@
+"""Pay a worker's one-off startup costs before it accepts traffic.
+
+Called from gunicorn's post_worker_init hook (see gunicorn.conf.py) so the first
+requests a new worker serves don't compile templates, build the URL resolver or
+open database connections.
+"""
+import logging
+import os
+import time
+
+from django.db import connections
+from django.template import TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.urls import Resolver404, get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def compile_templates():
+    """Load every template so the cached loader holds them compiled."""
+    count = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        for directory in engine.template_dirs:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if not filename.endswith(('.html', '.txt')):
+                        continue
+                    name = os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/')
+                    try:
+                        engine.get_template(name)
+                    except TemplateSyntaxError:
+                        logger.exception('Could not compile template %s', name)
+                    else:
+                        count += 1
+    return count
+
+
+def populate_urls():
+    """Import every urlconf and view module and compile all URL patterns."""
+    resolver = get_resolver()
+    # Building the reverse lookup imports task_manager_app.urls and its views
+    resolver.reverse_dict
+    # A path nothing matches makes the resolver try, and so compile, every pattern
+    try:
+        resolver.resolve('/__warmup__/')
+    except Resolver404:
+        pass
+    return len(resolver.reverse_dict)
+
+
+def open_connections():
+    """Connect to every configured database; CONN_MAX_AGE keeps them open for requests."""
+    for connection in connections.all():
+        connection.ensure_connection()
+    return len(connections.all())
+
+
+def warmup(databases=True):
+    """Run each warmup step and return how long it took, in seconds."""
+    steps = [('templates', compile_templates), ('urls', populate_urls)]
+    if databases:
+        steps.append(('databases', open_connections))
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        count = step()
+        timings[name] = time.perf_counter() - started
+        logger.info('Warmup %s: %d in %.1f ms', name, count, timings[name] * 1000)
+    return timings